@@ -0,0 +1,140 @@
+# 声学特征批量计算：声层深度、深海声道轴、混合层深度、表面声道截止频率、调和平均声速
+# 所有特征都在 NaN 填充的二维数组上对整个剖面集合同时计算，不逐剖面循环
+
+from typing import List
+
+import numpy as np
+
+from .SoundVelocityProfile import SoundVelocityProfile, stack_profiles, compact_profiles, layer_time
+
+# 特征名 -> (列标题, 单位)，顺序即列表视图中的列顺序
+FEATURES = {
+    'sld': ('SLD', 'm'),
+    'channel_depth': ('Channel axis', 'm'),
+    'channel_speed': ('Channel speed', 'm/s'),
+    'mld': ('MLD', 'm'),
+    'cutoff_frequency': ('Duct cutoff', 'Hz'),
+    'harmonic_speed': ('Harmonic speed', 'm/s'),
+}
+
+
+def _row_pick(a, col):
+    return np.take_along_axis(a, col[:, None], axis=1)[:, 0]
+
+
+def speed_features(depth, speed):
+    """
+    由声速剖面计算声道特征\n
+    深海声道轴取声速极小值所在深度，极小值位于剖面最深处时轴可能在测量范围以下，记为 NaN；
+    声层深度 (SLD) 取声道轴以上声速极大值所在深度；
+    表面声道截止频率按 Urick 的近似 λ_max = 0.008·SLD^1.5 (m) 计算，声速在表层即开始减小（无表面声道）时为 NaN；
+    调和平均声速为剖面深度范围除以垂直单程传播时间\n
+    :param depth: 深度 (m)，形状 (n_level,) 或 (n_svp, n_level)，NaN 为填充
+    :param speed: 声速 (m/s)，与 depth 同形状
+    :return: dict，键为 sld / channel_depth / channel_speed / cutoff_frequency / harmonic_speed，值形状 (n_svp,)
+    """
+    depth = np.atleast_2d(np.asarray(depth, dtype=float))
+    speed = np.atleast_2d(np.asarray(speed, dtype=float))
+    n, m = depth.shape
+    if m == 0:
+        return {name: np.full(n, np.nan) for name in
+                ('sld', 'channel_depth', 'channel_speed', 'cutoff_frequency', 'harmonic_speed')}
+    z, c, num_valid, _ = compact_profiles(depth, speed)
+    has_data = num_valid > 0
+    cols = np.arange(m)[None, :]
+
+    # 声道轴：声速最小的采样点
+    axis_col = np.where(np.isfinite(c), c, np.inf).argmin(axis=1)
+    axis_found = has_data & (axis_col < num_valid - 1)
+    channel_depth = np.where(axis_found, _row_pick(z, axis_col), np.nan)
+    channel_speed = np.where(axis_found, _row_pick(c, axis_col), np.nan)
+
+    # 声层深度：轴（含）以上声速最大的采样点
+    above = (cols <= axis_col[:, None]) & np.isfinite(c)
+    sld_col = np.where(above, c, -np.inf).argmax(axis=1)
+    sld = np.where(has_data, _row_pick(z, sld_col), np.nan)
+
+    # 表面声道截止频率：λ_max = 0.008·D^1.5，f = c / λ_max
+    duct = has_data & (sld_col > 0) & (sld > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cutoff = _row_pick(c, sld_col) / (0.008 * sld ** 1.5)
+    cutoff = np.where(duct, cutoff, np.nan)
+
+    # 调和平均声速：逐层按线性声速梯度积分传播时间
+    t = layer_time(z[:, :-1], c[:, :-1], z[:, 1:], c[:, 1:])
+    total_time = np.nansum(np.where(np.isfinite(t), t, 0.0), axis=1)
+    last = np.maximum(num_valid - 1, 0)
+    span = _row_pick(z, last) - z[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = span / total_time
+    harmonic = np.where(num_valid > 1, harmonic, np.where(num_valid == 1, c[:, 0], np.nan))
+
+    return {
+        'sld': sld,
+        'channel_depth': channel_depth,
+        'channel_speed': channel_speed,
+        'cutoff_frequency': cutoff,
+        'harmonic_speed': harmonic,
+    }
+
+
+def mixed_layer_depth(depth, temperature, threshold=0.2, ref_depth=10.0):
+    """
+    温度阈值法混合层深度 (de Boyer Montégut 等, 2004)：温度与参考深度处相差超过 threshold 的深度，
+    在相邻采样点间线性插值；参考深度浅于第一个采样点时以第一个采样点为参考，全剖面都未超过阈值时为 NaN\n
+    :param depth: 深度 (m)，形状 (n_level,) 或 (n_svp, n_level)，NaN 为填充
+    :param temperature: 温度 (°C)，与 depth 同形状
+    :param threshold: 温度阈值 (°C)
+    :param ref_depth: 参考深度 (m)
+    :return: 形状 (n_svp,)
+    """
+    depth = np.atleast_2d(np.asarray(depth, dtype=float))
+    temperature = np.atleast_2d(np.asarray(temperature, dtype=float))
+    n, m = depth.shape
+    if m == 0:
+        return np.full(n, np.nan)
+    z, t, num_valid, _ = compact_profiles(depth, temperature)
+
+    # 参考温度：在 ref_depth 处插值
+    right = np.count_nonzero(z <= ref_depth, axis=1)
+    lo = np.clip(right - 1, 0, m - 1)
+    hi = np.clip(right, 0, m - 1)
+    z0, z1 = _row_pick(z, lo), _row_pick(z, hi)
+    t0, t1 = _row_pick(t, lo), _row_pick(t, hi)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_ref = np.where((z1 > z0) & (right < num_valid), t0 + (ref_depth - z0) / (z1 - z0) * (t1 - t0), t0)
+    t_ref = np.where(right == 0, t[:, 0], t_ref)
+    z_ref = np.maximum(ref_depth, z[:, 0])
+
+    # 参考深度以下第一个超过阈值的采样点
+    dev = np.abs(t - t_ref[:, None])
+    exceed = (dev > threshold) & (z > z_ref[:, None])
+    found = exceed.any(axis=1)
+    col = exceed.argmax(axis=1)
+    prev = np.maximum(col - 1, 0)
+    za, zb = _row_pick(z, prev), _row_pick(z, col)
+    da, db = _row_pick(dev, prev), _row_pick(dev, col)
+    # 上一个采样点在参考深度以上时从参考深度开始插值
+    za = np.maximum(za, z_ref)
+    da = np.where(_row_pick(z, prev) < z_ref, 0.0, da)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mld = np.where(db > da, za + (threshold - da) / (db - da) * (zb - za), zb)
+    return np.where(found, mld, np.nan)
+
+
+def extract_features(svps: List[SoundVelocityProfile]):
+    """
+    计算剖面集合的全部声学特征，并写入各剖面的 features 字典\n
+    :return: dict，键见 FEATURES，值形状 (len(svps),)
+    """
+    if not svps:
+        return {name: np.zeros(0) for name in FEATURES}
+    depth, speed = stack_profiles(svps)
+    features = speed_features(depth, speed)
+    temp_depth, temperature = stack_profiles(svps, ('depth', 'temperature'), qc='temp_qc')
+    features['mld'] = mixed_layer_depth(temp_depth, temperature)
+    features = {name: features[name] for name in FEATURES}
+
+    for i, svp in enumerate(svps):
+        svp.features = {name: float(values[i]) for name, values in features.items()}
+    return features
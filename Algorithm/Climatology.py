@@ -0,0 +1,191 @@
+# 月平均声速气候态：按块读取历史剖面，单遍增量统计 (月, 纬度, 经度, 深度) 网格内的均值、标准差和样本数
+# 文件以惰性方式打开，每次只读入 chunk_size 个剖面；统计量只保存出现过数据的网格单元，内存占用与网格总大小无关
+
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from .Interpolation import STANDARD_LEVELS, resample_profiles
+from .SoundSpeedModels import compute_speeds
+
+
+class ClimatologyBuilder:
+    def __init__(self, resolution=2.0, lat_range=(-90.0, 90.0), lon_range=(-180.0, 180.0), levels=STANDARD_LEVELS,
+                 model='coppens'):
+        """
+        :param resolution: 经纬度网格间距 (degree)
+        :param lat_range: 纬度范围 (degree)
+        :param lon_range: 经度范围 (degree)
+        :param levels: 深度层 (m)，剖面先插值到这些层再统计
+        :param model: 由温盐压计算声速时使用的公式，见 SoundSpeedModels.MODELS
+        """
+        self.resolution = resolution
+        self.model = model
+        self.lat_edges = np.arange(lat_range[0], lat_range[1] + 0.5 * resolution, resolution)
+        self.lon_edges = np.arange(lon_range[0], lon_range[1] + 0.5 * resolution, resolution)
+        self.levels = np.asarray(levels, dtype=float)
+
+        self.shape = (12, self.lat_edges.size - 1, self.lon_edges.size - 1, self.levels.size)
+        # 稀疏统计量：按展平序号升序排列的已有数据网格单元，及其样本数、均值和离差平方和
+        self.cells = np.zeros(0, dtype=np.int64)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.num_profiles = 0
+
+    def update(self, latitude, longitude, time, depth, speed):
+        """
+        加入一块剖面，按 Chan 等的并行方差公式与已有统计量合并\n
+        :param latitude: 纬度 (degree)，形状 (n_svp,)
+        :param longitude: 经度 (degree)，形状 (n_svp,)
+        :param time: 时间 (datetime64)，形状 (n_svp,)
+        :param depth: 深度 (m)，NaN 填充，形状 (n_svp, n_level)
+        :param speed: 声速 (m/s)，与 depth 同形状
+        """
+        latitude = np.asarray(latitude, dtype=float)
+        longitude = (np.asarray(longitude, dtype=float) - self.lon_edges[0]) % 360.0 + self.lon_edges[0]
+        time = np.asarray(time, dtype='datetime64[M]')
+
+        month = time.astype(np.int64) % 12
+        ilat = np.searchsorted(self.lat_edges, latitude, side='right') - 1
+        ilon = np.searchsorted(self.lon_edges, longitude, side='right') - 1
+        _, n_lat, n_lon, n_level = self.shape
+        inside = (ilat >= 0) & (ilat < n_lat) & (ilon >= 0) & (ilon < n_lon) & ~np.isnat(time)
+        if not inside.any():
+            return
+
+        values = resample_profiles(np.asarray(depth)[inside], np.asarray(speed)[inside], self.levels)
+        cell = (month[inside] * n_lat + ilat[inside]) * n_lon + ilon[inside]
+        flat = cell[:, None] * n_level + np.arange(n_level)[None, :]
+        valid = np.isfinite(values)
+        flat, values = flat[valid], values[valid]
+        self.num_profiles += int(inside.sum())
+        if flat.size == 0:
+            return
+
+        # 块内统计：只在出现过的网格单元上计算
+        cells, inv = np.unique(flat, return_inverse=True)
+        n_b = np.bincount(inv).astype(float)
+        mean_b = np.bincount(inv, weights=values) / n_b
+        m2_b = np.bincount(inv, weights=(values - mean_b[inv]) ** 2)
+
+        # 与已有网格单元合并，新出现的网格单元按序插入
+        pos = np.searchsorted(self.cells, cells)
+        found = pos < self.cells.size
+        found[found] = self.cells[pos[found]] == cells[found]
+        at = pos[found]
+        n_a = self.count[at].astype(float)
+        n = n_a + n_b[found]
+        delta = mean_b[found] - self.mean[at]
+        self.mean[at] += delta * n_b[found] / n
+        self.m2[at] += m2_b[found] + delta ** 2 * n_a * n_b[found] / n
+        self.count[at] += n_b[found].astype(np.int64)
+
+        new = ~found
+        if new.any():
+            self.cells = np.insert(self.cells, pos[new], cells[new])
+            self.count = np.insert(self.count, pos[new], n_b[new].astype(np.int64))
+            self.mean = np.insert(self.mean, pos[new], mean_b[new])
+            self.m2 = np.insert(self.m2, pos[new], m2_b[new])
+
+    def add_dataset(self, ds, chunk_size=10000):
+        """
+        逐块加入一个已打开（可为惰性）的数据集，支持两种布局：\n
+        SvpExport 导出的合并文件（DEPTH/SPEED/SPEED_QC），
+        或 Argo 文件（PRES_ADJUSTED/TEMP_ADJUSTED/PSAL_ADJUSTED，按 self.model 计算声速）
+        """
+        dim = ds['LATITUDE'].dims[0]
+        for start in range(0, ds.sizes[dim], chunk_size):
+            block = ds.isel({dim: slice(start, start + chunk_size)})
+            depth, speed = _block_speed(block, self.model)
+            self.update(block['LATITUDE'].values, block['LONGITUDE'].values, block['TIME'].values, depth, speed)
+
+    def add_file(self, path, chunk_size=10000):
+        path = Path(path)
+        ds = xr.open_zarr(path) if path.suffix == '.zarr' else xr.open_dataset(path)
+        with ds:
+            self.add_dataset(ds, chunk_size)
+
+    def to_dataset(self):
+        """
+        :return: xr.Dataset，变量 SPEED_MEAN / SPEED_STD / COUNT，维度 (month, latitude, longitude, depth)
+        """
+        # 只分配输出数组本身，由稀疏统计量直接填入
+        mean = np.full(self.shape, np.nan, dtype=np.float32)
+        std = np.full(self.shape, np.nan, dtype=np.float32)
+        count = np.zeros(self.shape, dtype=np.int32)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean.reshape(-1)[self.cells] = self.mean
+            std.reshape(-1)[self.cells] = np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+        count.reshape(-1)[self.cells] = self.count
+        dims = ('month', 'latitude', 'longitude', 'depth')
+        coords = {
+            'month': np.arange(1, 13),
+            'latitude': 0.5 * (self.lat_edges[:-1] + self.lat_edges[1:]),
+            'longitude': 0.5 * (self.lon_edges[:-1] + self.lon_edges[1:]),
+            'depth': self.levels,
+        }
+        ds = xr.Dataset({
+            'SPEED_MEAN': (dims, mean, {'units': 'm/s'}),
+            'SPEED_STD': (dims, std, {'units': 'm/s'}),
+            'COUNT': (dims, count),
+        }, coords=coords)
+        ds['depth'].attrs['units'] = 'm'
+        ds.attrs['resolution'] = self.resolution
+        ds.attrs['num_profiles'] = self.num_profiles
+        ds.attrs['model'] = self.model
+        return ds
+
+    def save(self, path):
+        path = Path(path)
+        ds = self.to_dataset()
+        if path.suffix == '.zarr':
+            ds.to_zarr(path, mode='w')
+        else:
+            encoding = {var: {'zlib': True} for var in ds.data_vars}
+            ds.to_netcdf(path, encoding=encoding)
+
+
+def _block_speed(block, model='coppens'):
+    """
+    从一块数据中取出 (深度, 声速)，未通过质量控制的采样点置为 NaN
+    """
+    if 'SPEED' in block.variables:
+        speed = block['SPEED'].values.astype(float)
+        if 'SPEED_QC' in block.variables:
+            speed[block['SPEED_QC'].values == 0] = np.nan
+        return block['DEPTH'].values.astype(float), speed
+
+    pres = block['PRES_ADJUSTED'].values.astype(float)
+    temp = block['TEMP_ADJUSTED'].values.astype(float)
+    sali = block['PSAL_ADJUSTED'].values.astype(float)
+    valid = np.ones(pres.shape, dtype=bool)
+    for name in ['PRES_ADJUSTED_QC', 'TEMP_ADJUSTED_QC', 'PSAL_ADJUSTED_QC']:
+        if name in block.variables:
+            valid &= np.broadcast_to(block[name].values > 0, pres.shape)
+    # 与 SoundVelocityProfile.preprocess 一致：按纬度将压强换算为深度
+    latitude = block['LATITUDE'].values.astype(float)[:, None]
+    depth, speeds, _ = compute_speeds(temp, sali, pres, np.where(np.isfinite(latitude), latitude, 45.0), (model,))
+    return np.where(valid, depth, np.nan), np.where(valid, speeds[model], np.nan)
+
+
+def build_climatology(paths, output=None, chunk_size=10000, **kwargs):
+    """
+    由一组文件构建月平均声速气候态\n
+    :param paths: NetCDF / Zarr 文件路径列表
+    :param output: 保存路径（.nc 或 .zarr），为 None 时不保存
+    :param kwargs: 传给 ClimatologyBuilder 的网格参数
+    :return: xr.Dataset
+    """
+    builder = ClimatologyBuilder(**kwargs)
+    for path in paths:
+        builder.add_file(path, chunk_size)
+    if output is not None:
+        builder.save(output)
+    return builder.to_dataset()
+
+
+def load_climatology(path):
+    path = Path(path)
+    return xr.open_zarr(path) if path.suffix == '.zarr' else xr.open_dataset(path)
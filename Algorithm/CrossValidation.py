@@ -0,0 +1,309 @@
+# 声速场重建 / 插值方法的交叉验证：留一法或 k 折，按深度和区域统计 RMSE，并记录各方法耗时
+# 所有方法共用一次 KD 树近邻检索；EOF 的协方差按折减去被留出的剖面（降阶更新），
+# 克里金只做一次矩阵求逆，各折的预测由闭式留出公式直接得到
+
+import time as _time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List
+
+import numpy as np
+import xarray as xr
+from scipy.linalg import cho_factor, cho_solve
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist
+
+from .Interpolation import STANDARD_LEVELS, geo_to_xyz, idw_average, resample_profiles, to_days
+from .SoundVelocityProfile import SoundVelocityProfile, stack_profiles
+
+# 默认验证深度层 (m)：Argo 剖面的第一个采样点通常在 5 m 左右，从 10 m 开始可保留大多数剖面
+VALIDATION_LEVELS = STANDARD_LEVELS[(STANDARD_LEVELS >= 10) & (STANDARD_LEVELS <= 1000)]
+
+
+class ValidationData:
+    def __init__(self, latitude, longitude, time, values, levels, fold, time_scale=10.0):
+        """
+        交叉验证的数据与共享的近邻索引\n
+        :param latitude: 剖面纬度 (degree)，形状 (n_svp,)
+        :param longitude: 剖面经度 (degree)，形状 (n_svp,)
+        :param time: 剖面时间 (datetime64)，形状 (n_svp,)
+        :param values: 剖面在 levels 上的声速 (m/s)，形状 (n_svp, n_level)，不含 NaN
+        :param levels: 深度层 (m)
+        :param fold: 每个剖面所属的折序号，形状 (n_svp,)
+        :param time_scale: 时间与空间距离的换算 (km/day)
+        """
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.longitude = np.asarray(longitude, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.levels = np.asarray(levels, dtype=float)
+        self.fold = np.asarray(fold)
+        self.coords = np.column_stack([geo_to_xyz(self.latitude, self.longitude), to_days(time) * time_scale])
+        self.tree = cKDTree(self.coords)
+        self._queries = {}
+        self._lock = Lock()
+
+    @property
+    def num_profiles(self):
+        return self.values.shape[0]
+
+    def _query(self, k_query):
+        # 全部剖面的近邻只检索一次，由所有方法和所有折共用
+        with self._lock:
+            if k_query not in self._queries:
+                dist, idx = self.tree.query(self.coords, k=k_query)
+                self._queries[k_query] = (dist.reshape(-1, k_query), idx.reshape(-1, k_query))
+            return self._queries[k_query]
+
+    def neighbours(self, test, k):
+        """
+        留出 test 所在的折后，每个 test 剖面的 k 个近邻\n
+        :param test: 剖面序号，test 中出现的折必须完整包含在 test 中
+        :return: (dist, idx)，形状 (len(test), k_query)，不可用的近邻距离为 inf
+        """
+        n = self.num_profiles
+        # 留一法只需多检索一个近邻；k 折时多检索一些，不够的剖面再单独检索
+        single = np.unique(self.fold).size == n
+        k_query = min(n, k + 1 if single else 2 * k + 1)
+        dist, idx = self._query(k_query)
+        dist, idx = dist[test].copy(), idx[test].copy()
+        fold = self.fold[test]
+
+        excluded = self.fold[np.minimum(idx, n - 1)] == fold[:, None]
+        dist[excluded] = np.inf
+        rank = np.cumsum(np.isfinite(dist), axis=1)
+        dist[rank > k] = np.inf
+
+        for f in np.unique(fold):
+            rows = np.flatnonzero((fold == f) & (np.isfinite(dist).sum(axis=1) < k))
+            train = np.flatnonzero(self.fold != f)
+            k_train = min(k, train.size)
+            if rows.size == 0 or k_train <= np.isfinite(dist[rows]).sum(axis=1).min():
+                continue
+            d, i = cKDTree(self.coords[train]).query(self.coords[test[rows]], k=k_train)
+            dist[rows] = np.inf
+            dist[rows, :k_train] = d.reshape(rows.size, k_train)
+            idx[rows, :k_train] = train[i.reshape(rows.size, k_train)]
+        return dist, np.minimum(idx, n - 1)
+
+    def fold_stats(self, test):
+        """
+        test 中各折留出后训练集的逐层均值，按 test 的行给出，形状 (len(test), n_level)
+        """
+        folds, inv = np.unique(self.fold[test], return_inverse=True)
+        n_out = np.bincount(inv).astype(float)
+        sum_out = np.zeros((folds.size, self.levels.size))
+        np.add.at(sum_out, inv, self.values[test])
+        mean = (self.values.sum(axis=0) - sum_out) / (self.num_profiles - n_out)[:, None]
+        return mean[inv]
+
+
+class IdwMethod:
+    def __init__(self, k=8, power=2.0):
+        """
+        时空反距离加权，与 Interpolation.IdwInterpolator 一致
+        """
+        self.k = k
+        self.power = power
+
+    def fit(self, data: ValidationData):
+        self.data = data
+
+    def predict(self, test):
+        dist, idx = self.data.neighbours(test, self.k)
+        return idw_average(dist, self.data.values[idx], self.power)
+
+
+class EofMethod:
+    def __init__(self, n_modes=5, k=8, power=2.0):
+        """
+        EOF 重建：训练剖面的前 n_modes 个经验正交函数，时间系数由近邻剖面反距离加权得到\n
+        各折的均值和协方差由全体统计量减去留出剖面的贡献得到，不重新扫描训练集
+        """
+        self.n_modes = n_modes
+        self.k = k
+        self.power = power
+
+    def fit(self, data: ValidationData):
+        self.data = data
+        # 先减去全体均值，避免累加平方和时有效数字损失
+        self.center = data.values.mean(axis=0)
+        x = data.values - self.center
+        self.sum = x.sum(axis=0)
+        self.scatter = x.T @ x
+
+    def predict(self, test):
+        data = self.data
+        x = data.values - self.center
+        folds, inv = np.unique(data.fold[test], return_inverse=True)
+        n_out = np.bincount(inv).astype(float)
+        sum_out = np.zeros((folds.size, x.shape[1]))
+        scatter_out = np.zeros((folds.size, x.shape[1], x.shape[1]))
+        np.add.at(sum_out, inv, x[test])
+        np.add.at(scatter_out, inv, x[test, :, None] * x[test, None, :])
+
+        # 降阶更新：训练集的均值和协方差
+        n_train = data.num_profiles - n_out
+        mean = (self.sum - sum_out) / n_train[:, None]
+        cov = (self.scatter - scatter_out - n_train[:, None, None] * mean[:, :, None] * mean[:, None, :]) \
+            / np.maximum(n_train - 1, 1)[:, None, None]
+        _, vectors = np.linalg.eigh(cov)
+        modes = vectors[:, :, ::-1][:, :, :self.n_modes]  # (n_fold, n_level, n_modes)
+
+        dist, idx = data.neighbours(test, self.k)
+        mean, modes = mean[inv], modes[inv]
+        coef = np.einsum('tkl,tlm->tkm', x[idx] - mean[:, None, :], modes)
+        coef = idw_average(dist, coef, self.power)
+        return self.center + mean + np.einsum('tm,tlm->tl', coef, modes)
+
+
+class KrigingMethod:
+    def __init__(self, length_scale=300.0, nugget=0.1):
+        """
+        简单克里金：各层共用指数型时空协方差 exp(-d / length_scale) + nugget，均值取训练集逐层均值\n
+        对全体剖面只求一次 P = K^-1，留出集合 F 的预测为
+        y_F - P_FF^-1 (P y)_F + P_FF^-1 (P 1)_F · m，m 为留出后训练集的均值，与在训练集上重新求解的结果相同\n
+        需要存储 n_svp × n_svp 的矩阵，适用于数千个剖面以内
+        :param length_scale: 相关尺度 (km，时间按 time_scale 换算)
+        :param nugget: 块金效应与基台值之比
+        """
+        self.length_scale = length_scale
+        self.nugget = nugget
+
+    def fit(self, data: ValidationData):
+        self.data = data
+        n = data.num_profiles
+        cov = np.exp(-cdist(data.coords, data.coords) / self.length_scale)
+        cov[np.diag_indices(n)] += self.nugget
+        factor = cho_factor(cov, overwrite_a=True)
+        self.precision = cho_solve(factor, np.eye(n), overwrite_b=True)
+        self.py = self.precision @ data.values
+        self.p1 = self.precision.sum(axis=1)
+
+    def predict(self, test):
+        data = self.data
+        y = data.values[test]
+        mean = data.fold_stats(test)
+        fold = data.fold[test]
+        if np.unique(data.fold).size == data.num_profiles:
+            # 留一法：P_FF 为标量
+            diag = self.precision[test, test][:, None]
+            return y - self.py[test] / diag + self.p1[test][:, None] / diag * mean
+
+        out = np.empty_like(y)
+        for f in np.unique(fold):
+            rows = np.flatnonzero(fold == f)
+            block = test[rows]
+            p_ff = self.precision[np.ix_(block, block)]
+            rhs = np.column_stack([self.py[block], self.p1[block]])
+            sol = np.linalg.solve(p_ff, rhs)
+            out[rows] = y[rows] - sol[:, :-1] + sol[:, -1:] * mean[rows]
+        return out
+
+
+def default_methods():
+    return {'idw': IdwMethod(), 'eof': EofMethod(), 'kriging': KrigingMethod()}
+
+
+def cross_validate(latitude, longitude, time, depth, speed, methods=None, levels=VALIDATION_LEVELS,
+                   n_folds=None, time_scale=10.0, region_resolution=10.0, batch_size=256, workers=4, seed=0):
+    """
+    对多种方法做交叉验证\n
+    剖面先插值到 levels，只使用在全部 levels 上都有数据的剖面，各方法在完全相同的留出集合上比较\n
+    :param latitude: 剖面纬度 (degree)，形状 (n_svp,)
+    :param longitude: 剖面经度 (degree)，形状 (n_svp,)
+    :param time: 剖面时间 (datetime64)，形状 (n_svp,)
+    :param depth: 剖面深度 (m)，NaN 填充，形状 (n_svp, n_level)
+    :param speed: 剖面声速 (m/s)，与 depth 同形状
+    :param methods: {方法名: 方法对象}，方法对象需提供 fit(data) 和 predict(test)；为 None 时比较 IDW / EOF / 克里金
+    :param levels: 验证深度层 (m)
+    :param n_folds: 折数，为 None 时为留一法
+    :param time_scale: 时间与空间距离的换算 (km/day)
+    :param region_resolution: 区域统计的经纬度网格间距 (degree)
+    :param batch_size: 留一法时每个任务包含的剖面数
+    :param workers: 并行执行的任务数
+    :param seed: k 折划分的随机数种子
+    :return: xr.Dataset，RMSE_DEPTH (method, depth)、RMSE_REGION (method, latitude, longitude)、
+             COUNT_REGION (latitude, longitude)、RMSE / FIT_TIME / PREDICT_TIME (method)
+    """
+    if methods is None:
+        methods = default_methods()
+    levels = np.asarray(levels, dtype=float)
+    values = resample_profiles(depth, speed, levels)
+    keep = np.isfinite(values).all(axis=1)
+    n = int(keep.sum())
+    if n < 2:
+        raise ValueError("在验证深度层上完整的剖面少于 2 个")
+    latitude = np.asarray(latitude, dtype=float)[keep]
+    longitude = np.asarray(longitude, dtype=float)[keep]
+    values = values[keep]
+
+    if n_folds is None or n_folds >= n:
+        fold = np.arange(n)
+        tasks = [np.arange(start, min(start + batch_size, n)) for start in range(0, n, batch_size)]
+    else:
+        fold = np.random.default_rng(seed).permutation(n) % n_folds
+        tasks = [np.flatnonzero(fold == f) for f in range(n_folds)]
+    data = ValidationData(latitude, longitude, np.asarray(time)[keep], values, levels, fold, time_scale)
+
+    names = list(methods)
+    errors = np.empty((len(names), n, levels.size))
+    fit_time = np.empty(len(names))
+    predict_time = np.empty(len(names))
+    for m, name in enumerate(names):
+        method = methods[name]
+        start = _time.perf_counter()
+        method.fit(data)
+        fit_time[m] = _time.perf_counter() - start
+
+        def run(test):
+            errors[m, test] = method.predict(test) - values[test]
+
+        start = _time.perf_counter()
+        # 各折相互独立，矩阵运算释放 GIL，可在线程池中并行
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, tasks))
+        predict_time[m] = _time.perf_counter() - start
+
+    # 区域统计
+    lat_edges = np.arange(-90.0, 90.0 + region_resolution, region_resolution)
+    lon_edges = np.arange(-180.0, 180.0 + region_resolution, region_resolution)
+    ilat = np.clip(np.searchsorted(lat_edges, latitude, side='right') - 1, 0, lat_edges.size - 2)
+    ilon = np.clip(np.searchsorted(lon_edges, (longitude + 180.0) % 360.0 - 180.0, side='right') - 1,
+                   0, lon_edges.size - 2)
+    cell = ilat * (lon_edges.size - 1) + ilon
+    n_cell = (lat_edges.size - 1) * (lon_edges.size - 1)
+    count = np.bincount(cell, minlength=n_cell)
+    sq = np.nanmean(errors ** 2, axis=2)
+    region_sq = np.array([np.bincount(cell, weights=s, minlength=n_cell) for s in sq])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rmse_region = np.sqrt(region_sq / count)
+    region_shape = (lat_edges.size - 1, lon_edges.size - 1)
+
+    ds = xr.Dataset({
+        'RMSE': ('method', np.sqrt(np.nanmean(errors ** 2, axis=(1, 2))), {'units': 'm/s'}),
+        'RMSE_DEPTH': (('method', 'depth'), np.sqrt(np.nanmean(errors ** 2, axis=1)), {'units': 'm/s'}),
+        'RMSE_REGION': (('method', 'latitude', 'longitude'), rmse_region.reshape((len(names),) + region_shape),
+                        {'units': 'm/s'}),
+        'COUNT_REGION': (('latitude', 'longitude'), count.reshape(region_shape)),
+        'FIT_TIME': ('method', fit_time, {'units': 's'}),
+        'PREDICT_TIME': ('method', predict_time, {'units': 's'}),
+    }, coords={
+        'method': names,
+        'depth': levels,
+        'latitude': 0.5 * (lat_edges[:-1] + lat_edges[1:]),
+        'longitude': 0.5 * (lon_edges[:-1] + lon_edges[1:]),
+    })
+    ds.attrs['num_profiles'] = n
+    ds.attrs['num_folds'] = int(np.unique(fold).size)
+    return ds
+
+
+def cross_validate_profiles(svps: List[SoundVelocityProfile], **kwargs):
+    """
+    对 SoundVelocityProfile 集合做交叉验证，参数同 cross_validate
+    """
+    depth, speed = stack_profiles(svps)
+    latitude = np.array([svp.latitude for svp in svps], dtype=float)
+    longitude = np.array([svp.longitude for svp in svps], dtype=float)
+    time = np.array([np.datetime64(svp.time, 's') for svp in svps])
+    return cross_validate(latitude, longitude, time, depth, speed, **kwargs)
@@ -0,0 +1,183 @@
+# CSV 剖面数据读取：Argo 数据门户 / CTD 导出的逐采样点表格，按块解析后整体分组为剖面
+# 输出与 Argo NetCDF 相同布局的 xr.Dataset，可直接用于 SoundVelocityProfile.fromDatasetAt / preprocess
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .SoundSpeedModels import depth_to_pressure
+
+# 标准列名 -> 可识别的表头（小写，去掉括号中的单位），靠前的优先
+COLUMN_ALIASES = {
+    'station': ['station', 'station_id', 'platform_number', 'platform', 'cast', 'profile', 'profile_id'],
+    'cycle': ['cycle_number', 'cycle'],
+    'time': ['time', 'juld', 'date_time', 'datetime', 'date'],
+    'latitude': ['latitude', 'lat'],
+    'longitude': ['longitude', 'lon', 'long'],
+    'pressure': ['pres_adjusted', 'pres', 'pressure', 'prs'],
+    # 只有深度列时按纬度换算为压强
+    'depth': ['depth', 'depth_m'],
+    'temperature': ['temp_adjusted', 'temp', 'temperature', 'te'],
+    'salinity': ['psal_adjusted', 'psal', 'salinity', 'sal'],
+    'pres_qc': ['pres_adjusted_qc', 'pres_qc'],
+    'temp_qc': ['temp_adjusted_qc', 'temp_qc'],
+    'psal_qc': ['psal_adjusted_qc', 'psal_qc'],
+    'pres_err': ['pres_adjusted_error'],
+    'temp_err': ['temp_adjusted_error'],
+    'psal_err': ['psal_adjusted_error'],
+}
+
+REQUIRED_COLUMNS = ('time', 'latitude', 'longitude')
+
+# 逐层变量：标准列名 -> (Dataset 变量名, QC 列名)
+LEVEL_COLUMNS = {
+    'pressure': ('PRES_ADJUSTED', 'pres_qc'),
+    'temperature': ('TEMP_ADJUSTED', 'temp_qc'),
+    'salinity': ('PSAL_ADJUSTED', 'psal_qc'),
+    'pres_err': ('PRES_ADJUSTED_ERROR', None),
+    'temp_err': ('TEMP_ADJUSTED_ERROR', None),
+    'psal_err': ('PSAL_ADJUSTED_ERROR', None),
+}
+
+# Argo 质量标志中视为可用的取值
+GOOD_FLAGS = (1, 2, 5, 8)
+
+
+def _normalize(name):
+    return str(name).split('(')[0].split('[')[0].strip().lower()
+
+
+def match_columns(header, columns=None):
+    """
+    将 CSV 表头对应到标准列名\n
+    :param header: CSV 表头列表
+    :param columns: 用户指定的 {标准列名: 表头}，优先于自动识别
+    :return: {标准列名: 表头}
+    """
+    lookup = {}
+    for name in header:
+        lookup.setdefault(_normalize(name), name)
+    mapping = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in lookup:
+                mapping[key] = lookup[alias]
+                break
+    if columns:
+        mapping.update(columns)
+    missing = [key for key in REQUIRED_COLUMNS if key not in mapping]
+    if 'pressure' not in mapping and 'depth' not in mapping:
+        missing.append('pressure')
+    if missing:
+        raise ValueError(f"CSV 缺少必需的列: {', '.join(missing)}")
+    return mapping
+
+
+def _units_row(path, mapping, **kwargs):
+    """
+    ERDDAP 等导出在表头下方有一行单位，检测到时跳过
+    """
+    first = pd.read_csv(path, nrows=1, dtype=str, **kwargs)
+    if first.empty:
+        return None
+    value = pd.to_numeric(first[mapping['latitude']], errors='coerce')
+    return [1] if value.isna().all() else None
+
+
+def read_profile_csv(path, columns=None, chunk_size=200000, **kwargs):
+    """
+    按块读取 CSV 格式的逐采样点剖面数据，按 (站位, 航次, 时间) 分组为剖面\n
+    每块只解析需要的列且类型固定，分组、排序和填充都是整体的数组操作\n
+    :param path: CSV 文件路径
+    :param columns: {标准列名: 表头}，覆盖自动识别结果，标准列名见 COLUMN_ALIASES
+    :param chunk_size: 每块读取的行数
+    :param kwargs: 传给 pandas.read_csv 的其他参数（sep、comment 等）
+    :return: xr.Dataset，维度 (TIME, DEPTH)，变量名与 Argo 文件一致
+    """
+    path = Path(path)
+    header = pd.read_csv(path, nrows=0, **kwargs).columns
+    mapping = match_columns(header, columns)
+    text_keys = [key for key in ('station', 'time') if key in mapping]
+    dtype = {mapping[key]: (str if key in text_keys else np.float64) for key in mapping}
+
+    parts = {key: [] for key in mapping}
+    reader = pd.read_csv(path, usecols=list(mapping.values()), dtype=dtype, chunksize=chunk_size,
+                         skiprows=_units_row(path, mapping, **kwargs), **kwargs)
+    for chunk in reader:
+        for key, name in mapping.items():
+            column = chunk[name]
+            if key == 'time':
+                column = pd.to_datetime(column, utc=True, errors='coerce').dt.tz_localize(None)
+                parts[key].append(column.to_numpy(dtype='datetime64[ns]'))
+            else:
+                parts[key].append(column.to_numpy())
+    data = {key: np.concatenate(value) if value else np.zeros(0) for key, value in parts.items()}
+    depth = data.pop('depth', None)
+    if 'pressure' not in data:
+        data['pressure'] = depth_to_pressure(depth, data['latitude'])
+
+    # 缺少时间、位置或压强的行无法归入剖面
+    keep = ~np.isnat(data['time']) & np.isfinite(data['latitude']) & np.isfinite(data['longitude']) \
+        & np.isfinite(data['pressure'])
+    data = {key: value[keep] for key, value in data.items()}
+    return _group_profiles(data, path)
+
+
+def _group_profiles(data, source):
+    """
+    将逐采样点数组分组为 (剖面, 层) 的二维数组并构造 Dataset
+    """
+    n_rows = data['time'].size
+    if 'station' in data:
+        station_code, stations = pd.factorize(data['station'], use_na_sentinel=False)
+    else:
+        # 没有站位列时以位置区分同一时刻的不同剖面
+        station_code, _ = pd.factorize(pd.MultiIndex.from_arrays([data['latitude'], data['longitude']]))
+        stations = None
+    cycle = data['cycle'] if 'cycle' in data else np.zeros(n_rows)
+    time = data['time'].astype(np.int64)
+
+    # 按 (站位, 航次, 时间, 压强) 排序，键变化处为新剖面
+    order = np.lexsort((data['pressure'], time, np.nan_to_num(cycle, nan=-1.0), station_code))
+    data = {key: value[order] for key, value in data.items()}
+    station_code, cycle, time = station_code[order], cycle[order], time[order]
+    new = np.ones(n_rows, dtype=bool)
+    if n_rows > 1:
+        new[1:] = (station_code[1:] != station_code[:-1]) | (time[1:] != time[:-1]) \
+            | ~((cycle[1:] == cycle[:-1]) | (np.isnan(cycle[1:]) & np.isnan(cycle[:-1])))
+    starts = np.flatnonzero(new)
+    profile = np.cumsum(new) - 1
+    level = np.arange(n_rows) - starts[profile]
+    n_prof = starts.size
+    n_level = int(level.max()) + 1 if n_rows else 0
+
+    ds = xr.Dataset()
+    ds['TIME'] = ('TIME', data['time'][starts])
+    ds['TIME_QC'] = ('TIME', np.ones(n_prof, dtype=np.int8))
+    ds['LATITUDE'] = ('TIME', data['latitude'][starts])
+    ds['LONGITUDE'] = ('TIME', data['longitude'][starts])
+    ds['POSITION_QC'] = ('TIME', np.ones(n_prof, dtype=np.int8))
+    if stations is not None:
+        ds['STATION'] = ('TIME', np.asarray(stations, dtype=str)[station_code[starts]])
+    if 'cycle' in data:
+        ds['CYCLE_NUMBER'] = ('TIME', data['cycle'][starts])
+
+    for key, (var, qc_key) in LEVEL_COLUMNS.items():
+        if key not in data:
+            continue
+        values = np.full((n_prof, n_level), np.nan)
+        values[profile, level] = data[key]
+        ds[var] = (('TIME', 'DEPTH'), values)
+        if qc_key is None:
+            continue
+        good = np.isfinite(data[key])
+        if qc_key in data:
+            good &= np.isin(data[qc_key], GOOD_FLAGS)
+        qc = np.zeros((n_prof, n_level), dtype=np.int8)
+        qc[profile, level] = good
+        ds[var + '_QC'] = (('TIME', 'DEPTH'), qc)
+
+    ds.encoding['source'] = str(source)
+    return ds
@@ -0,0 +1,204 @@
+# 声速场插值：剖面重采样到标准层 + 时空反距离加权 (IDW)
+
+import numpy as np
+from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+from .SoundVelocityProfile import compact_profiles
+
+EARTH_RADIUS = 6371.0  # km
+
+# 标准层深度 (m)，参照 World Ocean Atlas
+STANDARD_LEVELS = np.array([
+    0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 65, 70, 75, 80, 85, 90, 95, 100,
+    125, 150, 175, 200, 225, 250, 275, 300, 325, 350, 375, 400, 425, 450, 475, 500,
+    550, 600, 650, 700, 750, 800, 850, 900, 950, 1000, 1050, 1100, 1150, 1200, 1250, 1300, 1350, 1400,
+    1450, 1500, 1550, 1600, 1650, 1700, 1750, 1800, 1850, 1900, 1950, 2000,
+], dtype=float)
+
+
+def resample_profiles(depth, values, levels=STANDARD_LEVELS):
+    """
+    将 NaN 填充的剖面集合线性插值到统一深度层，超出剖面深度范围处为 NaN\n
+    :param depth: 深度 (m)，形状 (n_svp, n_level)
+    :param values: 逐层数值，与 depth 同形状
+    :param levels: 目标深度层 (m)，形状 (n_out,)
+    :return: 形状 (n_svp, n_out)
+    """
+    depth = np.atleast_2d(np.asarray(depth, dtype=float))
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    levels = np.asarray(levels, dtype=float)
+    n, m = depth.shape
+    if m == 0:
+        return np.full((n, levels.size), np.nan)
+
+    # 每行有效点按深度排序，无效点排到行尾
+    z, v, num_valid, _ = compact_profiles(depth, values)
+
+    # 行偏移后整体单调，一次 searchsorted 完成所有行的查找
+    span = np.abs(np.where(np.isfinite(z), z, 0.0)).max(initial=0.0) + np.abs(levels).max(initial=0.0) + 1.0
+    offset = 4.0 * span * np.arange(n)[:, None]
+    keys = np.where(np.isfinite(z), z, 2.0 * span) + offset
+    query = levels[None, :] + offset
+    # right：每行中深度不大于目标层的采样点数
+    right = np.searchsorted(keys.ravel(), query.ravel(), side='right').reshape(n, levels.size) \
+        - np.arange(n)[:, None] * m
+
+    rows = np.arange(n)[:, None]
+    lo = np.clip(right - 1, 0, m - 1)
+    hi = np.clip(right, 0, m - 1)
+    z0, z1 = z[rows, lo], z[rows, hi]
+    v0, v1 = v[rows, lo], v[rows, hi]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = v0 + (levels[None, :] - z0) / (z1 - z0) * (v1 - v0)
+    on_sample = (right >= 1) & (right <= num_valid[:, None]) & (z0 == levels[None, :])
+    between = (right >= 1) & (right < num_valid[:, None])
+    out = np.where(on_sample, v0, out)
+    return np.where(on_sample | between, out, np.nan)
+
+
+def geo_to_xyz(latitude, longitude):
+    """
+    经纬度 (degree) 转为地心直角坐标 (km)
+    """
+    lat = np.deg2rad(np.asarray(latitude, dtype=float))
+    lon = np.deg2rad(np.asarray(longitude, dtype=float))
+    cos_lat = np.cos(lat)
+    return EARTH_RADIUS * np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def to_days(time):
+    """
+    datetime64 / datetime 转为自 1970-01-01 起的天数
+    """
+    t = np.asarray(time, dtype='datetime64[s]')
+    return t.astype(np.int64) / 86400.0
+
+
+class IdwInterpolator:
+    def __init__(self, latitude, longitude, time, values, time_scale=10.0, k=8, power=2.0):
+        """
+        时空反距离加权插值，邻近剖面由 KD 树检索\n
+        :param latitude: 剖面纬度 (degree)，形状 (n_svp,)
+        :param longitude: 剖面经度 (degree)，形状 (n_svp,)
+        :param time: 剖面时间 (datetime64)，形状 (n_svp,)；为 None 时只做空间插值
+        :param values: 剖面在统一深度层上的数值，形状 (n_svp, n_out)，可含 NaN
+        :param time_scale: 时间与空间距离的换算 (km/day)
+        :param k: 参与加权的近邻剖面数
+        :param power: 距离权重的幂次
+        """
+        self.values = np.atleast_2d(np.asarray(values, dtype=float))
+        self.time_scale = time_scale
+        self.use_time = time is not None
+        self.k = min(k, self.values.shape[0])
+        self.power = power
+        self.tree = cKDTree(self._coords(latitude, longitude, time))
+
+    def _coords(self, latitude, longitude, time):
+        xyz = geo_to_xyz(latitude, longitude)
+        if not self.use_time:
+            return np.atleast_2d(xyz)
+        t = to_days(time) * self.time_scale
+        return np.atleast_2d(np.column_stack([np.atleast_2d(xyz), np.atleast_1d(t)]))
+
+    def __call__(self, latitude, longitude, time=None, exclude=None):
+        """
+        :param exclude: 每个查询点需排除的剖面序号（留一交叉验证用），形状 (n_query,)
+        :return: 形状 (n_query, n_out)
+        """
+        coords = self._coords(latitude, longitude, time if self.use_time else None)
+        k = self.k + (exclude is not None)
+        dist, idx = self.tree.query(coords, k=k)
+        dist = dist.reshape(len(coords), k)
+        idx = idx.reshape(len(coords), k)
+        return self.weighted(dist, idx, exclude)
+
+    def weighted(self, dist, idx, exclude=None):
+        """
+        由近邻距离和序号计算加权结果，忽略 NaN 数值
+        """
+        if exclude is not None:
+            dist = np.where(idx == np.asarray(exclude)[:, None], np.inf, dist)
+        # 近邻不足 k 个时 KD 树返回 inf 距离和越界序号
+        idx = np.minimum(idx, self.values.shape[0] - 1)
+        return idw_average(dist, self.values[idx], self.power)
+
+
+def idw_average(dist, values, power=2.0):
+    """
+    反距离加权平均，忽略 NaN 数值；距离为 inf 的近邻权重为 0\n
+    :param dist: 近邻距离，形状 (n_query, k)
+    :param values: 近邻数值，形状 (n_query, k, n_out)
+    :return: 形状 (n_query, n_out)
+    """
+    with np.errstate(divide='ignore'):
+        w = 1.0 / dist ** power
+    # 距离为 0 时直接取该剖面
+    hit = dist == 0
+    w = np.where(hit.any(axis=1, keepdims=True), hit.astype(float), w)
+
+    w = np.where(np.isfinite(values), w[:, :, None], 0.0)
+    total = w.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = np.nansum(values * w, axis=1) / total
+    return np.where(total > 0, out, np.nan)
+
+
+def volume_shape(east, north, max_depth, depth_step=10.0, points_per_profile=4, size_range=(32, 256),
+                 max_levels=1001, max_voxels=None):
+    """
+    由数据确定体网格大小：水平方向共约 (points_per_profile² × 剖面数) 个网格点，按东西、南北范围的比例分配；
+    垂直方向按 depth_step 等间距分层；总网格点数超过 max_voxels 时三个方向按同一比例缩小\n
+    :param east: 剖面投影坐标 (m)，形状 (n_svp,)
+    :param north: 剖面投影坐标 (m)，形状 (n_svp,)
+    :param max_depth: 最大深度 (m)
+    :param depth_step: 垂直层间距 (m)
+    :param size_range: 每个水平方向的网格点数范围
+    :param max_voxels: 总网格点数上限，如三维显示的体素预算；为 None 时不限制
+    :return: (shape, num_levels)，shape 为水平网格点数 (nx, ny)，可直接传给 grid_volume
+    """
+    east = np.asarray(east, dtype=float)
+    north = np.asarray(north, dtype=float)
+    side = points_per_profile * np.sqrt(east.size)
+    width, height = max(np.ptp(east), 1.0), max(np.ptp(north), 1.0)
+    aspect = np.sqrt(width / height)
+    size = [int(np.clip(round(side * r), *size_range)) for r in (aspect, 1.0 / aspect)]
+    size.append(int(np.clip(np.ceil(max_depth / depth_step) + 1, 2, max_levels)))
+    if max_voxels is not None:
+        scale = min(1.0, (max_voxels / np.prod(size)) ** (1.0 / 3.0))
+        size = [max(2, int(n * scale)) for n in size]
+    return (size[0], size[1]), size[2]
+
+
+def grid_volume(east, north, latitude, longitude, values, levels, shape=(48, 48), k=8, power=2.0,
+                max_elements=1 << 22):
+    """
+    将剖面集合插值到规则三维网格：水平为 Web Mercator 平面坐标，垂直为 levels\n
+    :param east: 剖面投影坐标 (m)，形状 (n_svp,)
+    :param north: 剖面投影坐标 (m)，形状 (n_svp,)
+    :param latitude: 剖面纬度 (degree)，形状 (n_svp,)
+    :param longitude: 剖面经度 (degree)，形状 (n_svp,)
+    :param values: 剖面在 levels 上的数值，形状 (n_svp, len(levels))
+    :param levels: 深度层 (m)；三维显示需要等间距
+    :param shape: 水平网格点数 (nx, ny)
+    :param max_elements: 单块的近邻数值个数上限 (网格点数 × k × 层数)，用于限制内存
+    :return: (east_axis, north_axis, volume)，volume 形状 (nx, ny, len(levels))
+    """
+    east = np.asarray(east, dtype=float)
+    north = np.asarray(north, dtype=float)
+    east_axis = np.linspace(east.min(), east.max(), shape[0])
+    north_axis = np.linspace(north.min(), north.max(), shape[1])
+    ee, nn = np.meshgrid(east_axis, north_axis, indexing='ij')
+
+    transformer = Transformer.from_crs("EPSG:3857", "EPSG:4326", always_xy=True)
+    lon, lat = transformer.transform(ee.ravel(), nn.ravel())
+
+    interpolator = IdwInterpolator(latitude, longitude, None, values, k=k, power=power)
+    # 按网格点分块插值，近邻数值数组 (块大小, k, 层数) 的大小不随网格增大
+    volume = np.empty((lat.size, interpolator.values.shape[1]), dtype=np.float32)
+    rows = max(1, max_elements // max(interpolator.k * volume.shape[1], 1))
+    for start in range(0, lat.size, rows):
+        sl = slice(start, start + rows)
+        volume[sl] = interpolator(lat[sl], lon[sl])
+    return east_axis, north_axis, volume.reshape(shape[0], shape[1], -1)
@@ -0,0 +1,137 @@
+# 声速剖面抽稀：Douglas-Peucker 式的误差受控简化，对整个剖面集合同时迭代
+
+from typing import List
+
+import numpy as np
+
+from .SoundVelocityProfile import SoundVelocityProfile, stack_profiles, compact_profiles, layer_time
+
+
+def _neighbour_kept(keep):
+    """
+    每个采样点上方（含自身）和下方（含自身）最近的保留点列号
+    """
+    m = keep.shape[1]
+    cols = np.arange(m)
+    prev = np.maximum.accumulate(np.where(keep, cols, 0), axis=1)
+    nxt = np.minimum.accumulate(np.where(keep, cols, m - 1)[:, ::-1], axis=1)[:, ::-1]
+    return prev, nxt
+
+
+def thinning_mask(depth, speed, tolerance=0.1, metric='speed', max_iter=None):
+    """
+    计算剖面抽稀后保留的采样点\n
+    每轮迭代在所有剖面的所有区段中同时插入误差最大的采样点，直到误差满足要求\n
+    :param depth: 深度 (m)，形状 (n_level,) 或 (n_svp, n_level)，NaN 为填充
+    :param speed: 声速 (m/s)，与 depth 同形状
+    :param tolerance: metric='speed' 时为声速最大误差 (m/s)，在所有原始层位上保证
+                      |c - c_thin| <= tolerance；metric='time' 时为垂直单程传播时间最大误差 (s)，
+                      在所有原始层位上保证累计传播时间误差 <= tolerance
+    :param metric: 'speed' 或 'time'
+    :param max_iter: 最大迭代次数，为 None 时迭代到误差满足要求为止；限定次数时不再保证误差上限
+    :return: 与输入同形状的布尔数组，True 为保留的采样点
+    """
+    if metric not in ('speed', 'time'):
+        raise ValueError(f"未知的误差类型 '{metric}'")
+
+    depth = np.asarray(depth, dtype=float)
+    speed = np.asarray(speed, dtype=float)
+    squeeze = depth.ndim == 1
+    depth = np.atleast_2d(depth)
+    speed = np.atleast_2d(speed)
+
+    z, c, num_valid, order = compact_profiles(depth, speed)
+    n, m = z.shape
+    if m == 0:
+        mask = np.zeros((n, m), dtype=bool)
+        return mask[0] if squeeze else mask
+    cols = np.arange(m)[None, :]
+    valid = cols < num_valid[:, None]
+
+    # 首尾采样点必须保留
+    last = np.maximum(num_valid - 1, 0)
+    keep = np.zeros((n, m), dtype=bool)
+    keep[:, 0] = True
+    keep[np.arange(n), last] = True
+
+    if metric == 'time':
+        # 原始剖面的累计传播时间
+        t_orig = np.zeros((n, m))
+        t_layer = layer_time(z[:, :-1], c[:, :-1], z[:, 1:], c[:, 1:])
+        np.cumsum(np.nan_to_num(t_layer), axis=1, out=t_orig[:, 1:])
+        # 按区段深度占比分配时间误差，各区段误差之和不超过 tolerance
+        total = z[np.arange(n), last] - z[:, 0]
+        total = np.where(total > 0, total, 1.0)
+
+    # 仅对仍有区段超限的剖面继续迭代
+    active = np.flatnonzero(num_valid > 2)
+    iteration = 0
+    while active.size and (max_iter is None or iteration < max_iter):
+        iteration += 1
+        width = num_valid[active].max()
+        za, ca, ka = z[active, :width], c[active, :width], keep[active, :width]
+        rows = np.arange(active.size)[:, None]
+        prev, nxt = _neighbour_kept(ka)
+        z0, c0 = za[rows, prev], ca[rows, prev]
+        z1, c1 = za[rows, nxt], ca[rows, nxt]
+        interior = valid[active, :width] & ~ka
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c_lin = c0 + (c1 - c0) * (za - z0) / (z1 - z0)
+            # 分割点总是取声速偏差最大的采样点，误差类型只决定区段是否需要分割
+            err = np.abs(ca - c_lin)
+            if metric == 'speed':
+                excess = err - tolerance
+            else:
+                ta = t_orig[active, :width]
+                t_start = ta[rows, prev]
+                err_time = np.abs((ta - t_start) - layer_time(z0, c0, za, c_lin))
+                # 区段末端（下一个保留点）处的误差同样要满足分配的额度
+                err_end = np.abs((ta[rows, nxt] - t_start) - layer_time(z0, c0, z1, c1))
+                excess = np.fmax(err_time, err_end) - tolerance * (z1 - z0) / total[active, None]
+
+        err = np.where(interior & np.isfinite(err), err, -np.inf)
+        excess = np.where(interior, excess, -np.inf)
+
+        # 每个区段从保留点开始、在行内连续排列，可用 reduceat 求区段最大值
+        starts = np.flatnonzero(ka)
+        seg_len = np.diff(np.append(starts, ka.size))
+        seg_err = np.repeat(np.maximum.reduceat(err.ravel(), starts), seg_len).reshape(ka.shape)
+        seg_excess = np.repeat(np.maximum.reduceat(excess.ravel(), starts), seg_len).reshape(ka.shape)
+
+        split = interior & (err == seg_err) & (seg_excess > 0)
+        keep[active, :width] = ka | split
+        active = active[split.any(axis=1)]
+
+    keep &= valid
+
+    # 还原到输入的列顺序
+    mask = np.zeros_like(keep)
+    np.put_along_axis(mask, order, keep, axis=1)
+    return mask[0] if squeeze else mask
+
+
+def compression_ratio(mask, depth=None):
+    """
+    抽稀压缩比：原始有效采样点数 / 保留采样点数\n
+    :param mask: thinning_mask 的结果
+    :param depth: 原始深度，用于统计有效采样点；为 None 时按 mask 的全部元素计
+    """
+    num_kept = np.count_nonzero(mask)
+    num_orig = np.size(mask) if depth is None else np.count_nonzero(np.isfinite(depth))
+    return num_orig / num_kept if num_kept else np.inf
+
+
+def thin_profiles(svps: List[SoundVelocityProfile], tolerance=0.1, metric='speed'):
+    """
+    对剖面集合整体抽稀\n
+    :return: ([(depth, speed), ...], 压缩比)，列表与 svps 一一对应，仅包含通过质量控制的保留点
+    """
+    depth, speed = stack_profiles(svps)
+    mask = thinning_mask(depth, speed, tolerance, metric)
+    thinned = []
+    for i in range(len(svps)):
+        row = mask[i]
+        order = np.argsort(depth[i, row])
+        thinned.append((depth[i, row][order], speed[i, row][order]))
+    return thinned, compression_ratio(mask, depth)
@@ -0,0 +1,230 @@
+# 多波束声线跟踪（常梯度分层 + Snell 定律）
+# 声速剖面只在构造时分层一次，之后整条测线（ping × beam）的波束一次性向量化求解
+
+import time
+
+import numpy as np
+
+
+class RayTracer:
+    def __init__(self, depth, speed, draft=0.0, surface_speed=None):
+        """
+        由声速剖面构造常梯度分层\n
+        :param depth: 剖面深度 (m, 向下为正)
+        :param speed: 剖面声速 (m/s)，与 depth 等长，NaN 采样点会被剔除
+        :param draft: 换能器吃水 (m)，分层从该深度开始
+        :param surface_speed: 换能器处表层声速 (m/s)，为 None 时由剖面插值得到
+        """
+        depth = np.asarray(depth, dtype=float).ravel()
+        speed = np.asarray(speed, dtype=float).ravel()
+        if depth.size != speed.size:
+            raise ValueError("depth 与 speed 长度不一致")
+
+        valid = np.isfinite(depth) & np.isfinite(speed)
+        depth, speed = depth[valid], speed[valid]
+        if depth.size == 0:
+            raise ValueError("声速剖面没有有效采样点")
+
+        # 按深度排序并去除重复深度
+        depth, idx = np.unique(depth, return_index=True)
+        speed = speed[idx]
+
+        # 截取吃水以下部分，并在吃水处补一个界面
+        c_draft = np.interp(draft, depth, speed)
+        below = depth > draft
+        z = np.concatenate(([draft], depth[below]))
+        c = np.concatenate(([c_draft], speed[below]))
+        if surface_speed is not None:
+            c[0] = surface_speed
+
+        self.draft = float(draft)
+        self.z = z
+        self.c = c
+        self.dz = np.diff(z)
+        dc = np.diff(c)
+        self.g = np.divide(dc, self.dz, out=np.zeros_like(dc), where=self.dz > 0)
+
+    @classmethod
+    def fromProfile(cls, svp, draft=0.0, surface_speed=None):
+        """
+        由 SoundVelocityProfile 构造，只使用通过质量控制的采样点
+        """
+        qc = np.broadcast_to(np.asarray(svp.speed_qc, dtype=bool), np.shape(svp.speed))
+        return cls(svp.depth[qc], svp.speed[qc], draft, surface_speed)
+
+    @property
+    def num_layers(self):
+        return self.dz.size
+
+    def layer_tables(self, p):
+        """
+        计算给定声线参数下各层界面处的累计单程时间和水平位移\n
+        :param p: 声线参数 sin(θ)/c (s/m)，形状 (n,)
+        :return: (t, x)，形状均为 (n, num_layers + 1)；声线在某层翻转后其下各界面为 inf
+        """
+        p = np.asarray(p, dtype=float)[:, None]
+        c_top = self.c[None, :-1]
+        c_bot = self.c[None, 1:]
+        g = self.g[None, :]
+        dz = self.dz[None, :]
+
+        sin_top = p * c_top
+        sin_bot = p * c_bot
+        turned = (sin_bot >= 1.0) | (sin_top >= 1.0)
+        cos_top = np.sqrt(np.clip(1.0 - sin_top ** 2, 0.0, None))
+        cos_bot = np.sqrt(np.clip(1.0 - sin_bot ** 2, 0.0, None))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            iso = np.abs(g) < 1e-9
+            # 常梯度层：圆弧轨迹
+            dt_grad = np.log((c_bot / c_top) * (1.0 + cos_top) / (1.0 + cos_bot)) / g
+            dx_grad = (cos_top - cos_bot) / (p * g)
+            # 等声速层：直线轨迹
+            dt_iso = dz / (c_top * cos_top)
+            dx_iso = dz * sin_top / cos_top
+
+            dt = np.where(iso, dt_iso, dt_grad)
+            dx = np.where(iso, dx_iso, dx_grad)
+            # 垂直声线 p=0 时 dx_grad 为 0/0
+            dx = np.where(p == 0.0, 0.0, dx)
+
+        # 翻转层及以下不可达
+        turned = np.logical_or.accumulate(turned, axis=1)
+        dt = np.where(turned, np.inf, dt)
+        dx = np.where(turned, np.inf, dx)
+
+        n = p.shape[0]
+        t_cum = np.zeros((n, self.num_layers + 1))
+        x_cum = np.zeros((n, self.num_layers + 1))
+        np.cumsum(dt, axis=1, out=t_cum[:, 1:])
+        np.cumsum(dx, axis=1, out=x_cum[:, 1:])
+        return t_cum, x_cum
+
+    def trace(self, angles, twtt, angle_step=None):
+        """
+        按双程旅行时计算波束脚印\n
+        :param angles: 波束入射角 (degree，相对铅垂，左舷为负)，可与 twtt 广播，例如 (n_beam,) 对 (n_ping, n_beam)
+        :param twtt: 双程旅行时 (s)
+        :param angle_step: 入射角查找表步长 (degree)。为 None 时按输入中不同的角度逐一建表，
+                           适合固定波束角；入射角逐 ping 变化（横摇补偿）时应给定步长，在相邻两条表声线间线性插值
+        :return: (depth, across)，与广播后的输入同形状；深度向下为正并包含吃水，横向距离带左右舷符号，无法求解处为 NaN
+        """
+        angles, twtt = np.broadcast_arrays(np.asarray(angles, dtype=float), np.asarray(twtt, dtype=float))
+        shape = angles.shape
+        angles = angles.ravel()
+        t_one = 0.5 * twtt.ravel()
+        theta = np.deg2rad(np.abs(angles))
+
+        if angle_step is None:
+            grid, idx = np.unique(theta, return_inverse=True)
+            p_grid = np.sin(grid) / self.c[0]
+            tables = self.layer_tables(p_grid)
+            depth, across = self._trace_table(p_grid, tables, idx, t_one)
+        else:
+            step = np.deg2rad(angle_step)
+            pos = theta / step
+            lo = np.floor(np.nan_to_num(pos)).astype(np.int64)
+            w = pos - lo
+            p_grid = np.sin(np.arange(lo.max(initial=0) + 2) * step) / self.c[0]
+            tables = self.layer_tables(p_grid)
+            z_lo, x_lo = self._trace_table(p_grid, tables, lo, t_one)
+            z_hi, x_hi = self._trace_table(p_grid, tables, lo + 1, t_one)
+            depth = (1.0 - w) * z_lo + w * z_hi
+            across = (1.0 - w) * x_lo + w * x_hi
+
+        across = across * np.sign(angles)
+        return depth.reshape(shape), across.reshape(shape)
+
+    def _trace_table(self, p_grid, tables, idx, t):
+        """
+        求第 idx 条表声线在单程时间 t 时的位置，tables 为 layer_tables(p_grid) 的结果
+        """
+        t_cum, x_cum = tables
+
+        layer = self._locate_layer(t_cum, idx, t)
+        valid = (layer >= 0) & np.isfinite(t)
+        layer = np.clip(layer, 0, self.num_layers)
+
+        p = p_grid[idx]
+        t0 = t_cum[idx, layer]
+        x0 = x_cum[idx, layer]
+        z0 = self.z[layer]
+        c0 = self.c[layer]
+        dt = t - t0
+        valid &= np.isfinite(t0)
+
+        # 最后一个界面以下按等声速外推
+        inside = layer < self.num_layers
+        g = np.where(inside, self.g[np.minimum(layer, self.num_layers - 1)], 0.0)
+
+        sin0 = np.clip(p * c0, 0.0, 1.0)
+        cos0 = np.sqrt(1.0 - sin0 ** 2)
+        theta0 = np.arcsin(sin0)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            iso = np.abs(g) < 1e-9
+            # 常梯度层内：tan(θ/2) 随时间按 exp(g·t) 变化
+            theta1 = 2.0 * np.arctan(np.tan(0.5 * theta0) * np.exp(g * dt))
+            c1 = np.where(p > 0, np.sin(theta1) / p, c0 * np.exp(g * dt))
+            cos1 = np.cos(theta1)
+            z_grad = z0 + (c1 - c0) / g
+            x_grad = np.where(p > 0, (cos0 - cos1) / (p * g), 0.0)
+
+            z_iso = z0 + dt * c0 * cos0
+            x_iso = dt * c0 * sin0
+
+            z = np.where(iso, z_iso, z_grad)
+            x = x0 + np.where(iso, x_iso, x_grad)
+
+        z = np.where(valid, z, np.nan)
+        x = np.where(valid, x, np.nan)
+        return z, x
+
+    @staticmethod
+    def _locate_layer(t_cum, idx, t):
+        """
+        返回 t_cum[idx[k]] 中不超过 t[k] 的最后一个界面序号，
+        查询按表声线分组后逐组 searchsorted，避免按声线展开整张分层表
+        """
+        order = np.argsort(idx, kind='stable')
+        sorted_idx = idx[order]
+        rows = np.unique(sorted_idx)
+        bounds = np.searchsorted(sorted_idx, np.append(rows, rows[-1] + 1)) if rows.size else []
+
+        layer = np.empty(t.size, dtype=np.int64)
+        for k, row in enumerate(rows):
+            sel = order[bounds[k]:bounds[k + 1]]
+            layer[sel] = np.searchsorted(t_cum[row], t[sel], side='right') - 1
+        return layer
+
+
+def benchmark(n_ping=2000, n_beam=512, n_level=1000, roll=True, angle_step=0.01, repeat=3):
+    """
+    以合成剖面和合成测线评估声线跟踪耗时\n
+    :return: 每次完整测线跟踪的平均耗时 (s)
+    """
+    depth = np.linspace(0.0, 5000.0, n_level)
+    speed = 1480.0 + 20.0 * np.exp(-depth / 300.0) + 0.016 * depth
+    tracer = RayTracer(depth, speed, draft=5.0)
+
+    rng = np.random.default_rng(0)
+    angles = np.linspace(-65.0, 65.0, n_beam)[None, :]
+    if roll:
+        angles = angles + rng.normal(0.0, 2.0, (n_ping, 1))
+    else:
+        angles = np.broadcast_to(angles, (n_ping, n_beam))
+    twtt = 2.0 * 3000.0 / np.cos(np.deg2rad(angles)) / 1500.0
+
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tracer.trace(angles, twtt, angle_step=angle_step)
+        elapsed.append(time.perf_counter() - start)
+    return float(np.mean(elapsed))
+
+
+if __name__ == "__main__":
+    for n_level in [50, 1000]:
+        for roll, angle_step in [(False, None), (True, 0.01)]:
+            cost = benchmark(2000, 512, n_level, roll, angle_step)
+            print(f"2000 pings × 512 beams, {n_level} levels, roll={roll}, angle_step={angle_step}: {cost:.3f} s")
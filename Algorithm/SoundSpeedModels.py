@@ -0,0 +1,130 @@
+# 声速公式调度：压强/深度换算、单位换算、公式适用范围检查
+# 各公式统一以 (温度, 盐度, 压强 dbar, 纬度) 为输入，换算结果在多个公式之间共用
+
+import numpy as np
+
+from .SoundSpeedSea import sound_speed_sea_coppens, sound_speed_sea_mackenzie, sound_speed_sea_delgrosso, \
+    sound_speed_sea_unesco, sound_speed_sea_npl
+
+DBAR_TO_KPA = 10.0
+
+# 公式名 -> (公式, 第三个输入类型, 适用范围)
+# 'depth' 以深度 (m) 为输入，'pressure' 以压强 (kPa) 为输入，'depth_latitude' 另需纬度 (degree)
+# 适用范围为 {输入: (下限, 上限)}，T 温度 (°C)、S 盐度 (ppt)、D 深度 (m)、P 压强 (kPa)
+MODELS = {
+    'coppens': (sound_speed_sea_coppens, 'depth', {'T': (-2.0, 35.0), 'S': (0.0, 42.0), 'D': (0.0, 4000.0)}),
+    'mackenzie': (sound_speed_sea_mackenzie, 'depth', {'T': (-2.0, 30.0), 'S': (25.0, 40.0), 'D': (0.0, 8000.0)}),
+    'delgrosso': (sound_speed_sea_delgrosso, 'pressure', {'T': (0.0, 35.0), 'S': (29.0, 43.0), 'P': (0.0, 98000.0)}),
+    'unesco': (sound_speed_sea_unesco, 'pressure', {'T': (0.0, 40.0), 'S': (5.0, 40.0), 'P': (0.0, 100000.0)}),
+    'npl': (sound_speed_sea_npl, 'depth_latitude', {'T': (-1.0, 30.0), 'S': (0.0, 42.0), 'D': (0.0, 12000.0)}),
+}
+
+
+def pressure_to_depth(pressure, latitude):
+    """
+    压强转深度，UNESCO 1983 (Fofonoff & Millard) 公式，计入重力随纬度和深度的变化\n
+    :param pressure: 海水压强 (dbar)，可为 NaN 填充的二维数组
+    :param latitude: 纬度 (degree)，与 pressure 可广播，如形状 (n_svp, 1)
+    :return: 深度 (m)
+    """
+    p = np.asarray(pressure, dtype=float)
+    x = np.sin(np.deg2rad(np.asarray(latitude, dtype=float))) ** 2
+    g = 9.780318 * (1.0 + (5.2788e-3 + 2.36e-5 * x) * x) + 1.092e-6 * p
+    return ((((-1.82e-15 * p + 2.279e-10) * p - 2.2512e-5) * p + 9.72659) * p) / g
+
+
+def depth_to_pressure(depth, latitude, num_iter=3):
+    """
+    深度转压强，对 pressure_to_depth 做牛顿迭代，3 次迭代后误差远小于 1e-6 dbar\n
+    :param depth: 深度 (m)
+    :param latitude: 纬度 (degree)，与 depth 可广播
+    :return: 海水压强 (dbar)
+    """
+    depth = np.asarray(depth, dtype=float)
+    p = depth * 1.01
+    for _ in range(num_iter):
+        h = 1e-3
+        d0 = pressure_to_depth(p, latitude)
+        slope = (pressure_to_depth(p + h, latitude) - d0) / h
+        p = p - (d0 - depth) / slope
+    return p
+
+
+def model_inputs(model, temperature, salinity, pressure, latitude, depth=None):
+    """
+    按公式要求的输入和单位组织参数\n
+    :param pressure: 压强 (dbar)
+    :param latitude: 纬度 (degree)，与 pressure 可广播
+    :param depth: 已换算的深度 (m)，为 None 时由压强和纬度计算
+    :return: 公式的位置参数元组
+    """
+    kind = MODELS[model][1]
+    if kind == 'pressure':
+        return temperature, salinity, np.asarray(pressure, dtype=float) * DBAR_TO_KPA
+    if depth is None:
+        depth = pressure_to_depth(pressure, latitude)
+    if kind == 'depth_latitude':
+        return temperature, salinity, depth, latitude
+    return temperature, salinity, depth
+
+
+def speed_function(model):
+    """
+    :return: 以 (温度, 盐度, 压强 dbar, 纬度) 为输入的声速函数，压强误差经深度换算一并传播
+    """
+    formula = MODELS[model][0]
+
+    def speed(temperature, salinity, pressure, latitude):
+        return formula(*model_inputs(model, temperature, salinity, pressure, latitude))
+    return speed
+
+
+def _range_mask(ranges, values):
+    arrays = [np.asarray(values[key], dtype=float) for key in ranges]
+    mask = np.ones(np.broadcast_shapes(*[a.shape for a in arrays]), dtype=bool)
+    for a, (lo, hi) in zip(arrays, ranges.values()):
+        mask &= (a >= lo) & (a <= hi)
+    return mask
+
+
+def validity_mask(model, temperature, salinity, pressure, depth):
+    """
+    输入是否在公式适用范围内（含端点），NaN 视为超出范围\n
+    :param pressure: 压强 (dbar)
+    :param depth: 深度 (m)
+    """
+    values = {'T': temperature, 'S': salinity, 'D': depth, 'P': np.asarray(pressure, dtype=float) * DBAR_TO_KPA}
+    return _range_mask(MODELS[model][2], values)
+
+
+def compute_speeds(temperature, salinity, pressure, latitude, models=('coppens',), depth=None):
+    """
+    在同一批数组上计算多个公式的声速：深度和 kPa 压强只换算一次，由各公式共用\n
+    :param temperature: 温度 (°C)，如形状 (n_svp, n_level)
+    :param salinity: 盐度 (ppt)，与 temperature 同形状
+    :param pressure: 压强 (dbar)，与 temperature 同形状
+    :param latitude: 纬度 (degree)，可广播，如形状 (n_svp, 1)
+    :param models: 公式名列表，见 MODELS
+    :param depth: 已换算的深度 (m)，为 None 时由压强和纬度计算
+    :return: (depth, speeds, valid)，speeds / valid 为 {公式名: 数组}，valid 为适用范围掩码
+    """
+    temperature = np.asarray(temperature, dtype=float)
+    salinity = np.asarray(salinity, dtype=float)
+    pressure = np.asarray(pressure, dtype=float)
+    latitude = np.asarray(latitude, dtype=float)
+    if depth is None:
+        depth = pressure_to_depth(pressure, latitude)
+    kpa = pressure * DBAR_TO_KPA
+
+    inputs = {
+        'depth': (temperature, salinity, depth),
+        'pressure': (temperature, salinity, kpa),
+        'depth_latitude': (temperature, salinity, depth, latitude),
+    }
+    values = {'T': temperature, 'S': salinity, 'D': depth, 'P': kpa}
+    speeds, valid = {}, {}
+    for model in models:
+        formula, kind, ranges = MODELS[model]
+        speeds[model] = formula(*inputs[kind])
+        valid[model] = _range_mask(ranges, values)
+    return depth, speeds, valid
@@ -3,7 +3,7 @@ from typing import List
 import numpy as np
 import xarray as xr
 from pathlib import Path
-from .SoundSpeedSea import sound_speed_sea_coppens
+from .SoundSpeedModels import MODELS, compute_speeds, pressure_to_depth
 from pyproj import Transformer
 
 
@@ -21,10 +21,23 @@ class SoundVelocityProfile:
         self.temp_qc = False
         self.salinity = np.array([])
         self.sali_qc = False
+        # 逐层测量误差 (*_ADJUSTED_ERROR)，缺失时为空数组
+        self.pres_err = np.array([])
+        self.temp_err = np.array([])
+        self.sali_err = np.array([])
         self.depth = np.array([])
         self.dep_qc = False
         self.speed = np.array([])
         self.speed_qc = False
+        # 多个经验公式的声速及适用范围掩码，{公式名: 逐层数组}，见 SoundSpeedModels.MODELS
+        self.speeds = {}
+        self.speed_valid = {}
+        # 声速不确定度：标准差及分位数区间的上下限
+        self.speed_std = np.array([])
+        self.speed_lower = np.array([])
+        self.speed_upper = np.array([])
+        # 声学特征（AcousticFeatures.extract_features），键见 FEATURES
+        self.features = {}
         self.status = 0
 
         self.east = 0.0
@@ -56,37 +69,125 @@ class SoundVelocityProfile:
         self.position_qc = dataset['POSITION_QC'].data[index] > 0
         self.pressure = dataset['PRES_ADJUSTED'].data[index,:]
         self.pres_qc = dataset['PRES_ADJUSTED_QC'].data[index] > 0
+        if 'PRES_ADJUSTED_ERROR' in dataset.variables:
+            self.pres_err = dataset['PRES_ADJUSTED_ERROR'].data[index, :]
 
         if 'TEMP_ADJUSTED' in dataset.variables:
             self.temperature = dataset['TEMP_ADJUSTED'].data[index, :]
             self.temp_qc = dataset['TEMP_ADJUSTED_QC'].data[index] > 0
+            if 'TEMP_ADJUSTED_ERROR' in dataset.variables:
+                self.temp_err = dataset['TEMP_ADJUSTED_ERROR'].data[index, :]
 
         if 'PSAL_ADJUSTED' in dataset.variables:
             self.salinity = dataset['PSAL_ADJUSTED'].data[index,:]
             self.sali_qc = dataset['PSAL_ADJUSTED_QC'].data[index] > 0
-
-
-    # 预处理：坐标投影、计算声速
-    def preprocess(self, model='coppens'):
-        self.depth = self.pressure
-        self.dep_qc = self.pres_qc
-
-        # 坐标投影
-        if not self.position_qc:
-            return
-        # WGS84到Web Mercator的转换
+            if 'PSAL_ADJUSTED_ERROR' in dataset.variables:
+                self.sali_err = dataset['PSAL_ADJUSTED_ERROR'].data[index, :]
+
+
+    # 预处理：坐标投影、压强转深度、计算声速
+    def preprocess(self, model='coppens', models=None):
+        preprocess_profiles([self], model, models)
+
+def stack_profiles(svps: List[SoundVelocityProfile], fields=('depth', 'speed'), qc='speed_qc'):
+    """
+    将剖面集合的逐层数据堆叠为 NaN 填充的二维数组，供整体向量化计算使用\n
+    :param svps: SoundVelocityProfile 列表
+    :param fields: 需要堆叠的逐层属性名
+    :param qc: 逐层质量控制属性名，未通过的采样点置为 NaN；为 None 时不做筛选
+    :return: 与 fields 一一对应的数组元组，形状均为 (len(svps), 最大层数)
+    """
+    num_levels = max((np.size(getattr(svp, fields[0])) for svp in svps), default=0)
+    stacked = tuple(np.full((len(svps), num_levels), np.nan) for _ in fields)
+    for i, svp in enumerate(svps):
+        n = np.size(getattr(svp, fields[0]))
+        if n == 0 or any(np.size(getattr(svp, name)) != n for name in fields):
+            continue
+        valid = np.ones(n, dtype=bool)
+        if qc is not None:
+            valid = np.broadcast_to(np.asarray(getattr(svp, qc), dtype=bool), (n,))
+        for array, name in zip(stacked, fields):
+            array[i, :n] = np.where(valid, getattr(svp, name), np.nan)
+    return stacked
+
+
+def compact_profiles(depth, values):
+    """
+    将每行有效采样点按深度排序并移到行首，NaN 放到行尾\n
+    :param depth: 深度 (m)，形状 (n_svp, n_level)，NaN 为填充
+    :param values: 逐层数值，与 depth 同形状
+    :return: (depth, values, num_valid, order)，order 为排序后各列在原数组中的列号
+    """
+    valid = np.isfinite(depth) & np.isfinite(values)
+    key = np.where(valid, depth, np.inf)
+    order = np.argsort(key, axis=1, kind='stable')
+    depth = np.take_along_axis(np.where(valid, depth, np.nan), order, axis=1)
+    values = np.take_along_axis(np.where(valid, values, np.nan), order, axis=1)
+    return depth, values, np.count_nonzero(valid, axis=1), order
+
+
+def layer_time(z0, c0, z1, c1):
+    """
+    声速随深度线性变化时的垂直单程传播时间
+    """
+    dz = z1 - z0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        g = (c1 - c0) / dz
+        t_grad = np.log(c1 / c0) / g
+        t_iso = dz / c0
+    return np.where(np.abs(c1 - c0) < 1e-9, t_iso, t_grad)
+
+
+def preprocess_profiles(svps: List[SoundVelocityProfile], model='coppens', models=None):
+    """
+    对剖面集合整体预处理：坐标投影、按纬度将压强换算为深度、计算声速\n
+    所有剖面堆叠后一次完成换算，多个公式共用同一批换算结果\n
+    :param svps: SoundVelocityProfile 列表
+    :param model: 主公式，结果写入 speed
+    :param models: 需要同时计算的其他公式，结果与主公式一起写入 speeds / speed_valid；
+                   为 None 时只计算主公式，公式名见 SoundSpeedModels.MODELS
+    """
+    if not svps:
+        return
+    models = list(dict.fromkeys([model] + list(models or [])))
+    unknown = [name for name in models if name not in MODELS]
+    if unknown:
+        raise ValueError(f"未知的声速公式 {unknown}")
+
+    # 坐标投影：WGS84到Web Mercator的转换
+    projected = [svp for svp in svps if svp.position_qc]
+    if projected:
         transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
-        self.east, self.north = transformer.transform(self.longitude, self.latitude)
-        self.epsg = "EPSG:3857"
-        self.proj_qc = True
+        east, north = transformer.transform([svp.longitude for svp in projected],
+                                            [svp.latitude for svp in projected])
+        for svp, e, n in zip(projected, np.atleast_1d(east), np.atleast_1d(north)):
+            svp.east, svp.north = float(e), float(n)
+            svp.epsg = "EPSG:3857"
+            svp.proj_qc = True
+
+    # 压强转深度，纬度缺失时按 45° 计算
+    latitude = np.array([svp.latitude for svp in svps], dtype=float)[:, None]
+    latitude = np.where(np.isfinite(latitude), latitude, 45.0)
+    depth = pressure_to_depth(stack_profiles(svps, ('pressure',), qc=None)[0], latitude)
+    # 温盐层数与压强不一致的剖面在此堆叠中为 NaN，不计算声速
+    pressure, temperature, salinity = stack_profiles(svps, ('pressure', 'temperature', 'salinity'), qc=None)
+    _, speeds, valid = compute_speeds(temperature, salinity, pressure, latitude, models, depth=depth)
+
+    for i, svp in enumerate(svps):
+        n = np.size(svp.pressure)
+        svp.depth = depth[i, :n]
+        svp.dep_qc = svp.pres_qc
 
         # 计算声速
-        if self.temperature.size != self.salinity.size or self.salinity.size != self.depth.size:
-            return
-        if self.temperature.size == 0 or self.salinity.size == 0 or self.depth.size == 0:
-            return
-
-        self.speed_qc = np.logical_and.reduce([self.temp_qc, self.sali_qc, self.dep_qc])
-        if model == 'coppens':
-            self.speed = sound_speed_sea_coppens(self.temperature, self.salinity, self.depth)
-            self.status = 1
\ No newline at end of file
+        if not svp.position_qc:
+            continue
+        if svp.temperature.size != svp.salinity.size or svp.salinity.size != svp.depth.size:
+            continue
+        if svp.temperature.size == 0 or svp.salinity.size == 0 or svp.depth.size == 0:
+            continue
+
+        svp.speed_qc = np.logical_and.reduce([svp.temp_qc, svp.sali_qc, svp.dep_qc])
+        svp.speeds = {name: speeds[name][i, :n] for name in models}
+        svp.speed_valid = {name: valid[name][i, :n] for name in models}
+        svp.speed = svp.speeds[model]
+        svp.status = 1
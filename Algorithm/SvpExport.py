@@ -0,0 +1,284 @@
+# 声速剖面批量导出：CARIS SVP、Kongsberg ASVP 文本格式以及合并的 NetCDF / Zarr
+# 剖面按块准备（线程池并行），按顺序流式写出，不在内存中拼接整个文件
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import xarray as xr
+from netCDF4 import Dataset
+
+from .SoundVelocityProfile import SoundVelocityProfile, stack_profiles
+
+
+def _chunks(svps, chunk_size):
+    for start in range(0, len(svps), chunk_size):
+        yield start, svps[start:start + chunk_size]
+
+
+def _stream(prepare, consume, svps, chunk_size, workers):
+    """
+    线程池并行执行 prepare(start, chunk)，并按剖面顺序把结果交给 consume；
+    同时在途的块数受 workers 限制，内存占用与剖面总数无关
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for start, chunk in _chunks(svps, chunk_size):
+            pending.append(pool.submit(prepare, start, chunk))
+            if len(pending) >= 2 * workers:
+                consume(pending.popleft().result())
+        while pending:
+            consume(pending.popleft().result())
+
+
+def _to_datetime(t):
+    return np.datetime64(t, 's').astype(datetime)
+
+
+def _valid_levels(svp):
+    """
+    通过质量控制且有效的 (深度, 声速)，按深度排序
+    """
+    if svp.status != 1:
+        return np.empty(0), np.empty(0)
+    qc = np.broadcast_to(np.asarray(svp.speed_qc, dtype=bool), np.shape(svp.speed))
+    depth = np.asarray(svp.depth[qc], dtype=float)
+    speed = np.asarray(svp.speed[qc], dtype=float)
+    valid = np.isfinite(depth) & np.isfinite(speed)
+    order = np.argsort(depth[valid])
+    return depth[valid][order], speed[valid][order]
+
+
+def _format_levels(depth, speed):
+    # 一次格式化全部层，避免逐行拼接字符串
+    return ('%.2f %.2f\n' * depth.size) % tuple(np.c_[depth, speed].ravel().tolist())
+
+
+def _format_dms(value, width):
+    sign = '-' if value < 0 else ''
+    value = abs(value)
+    d = int(value)
+    m = int((value - d) * 60)
+    s = int(round(((value - d) * 60 - m) * 60))
+    if s == 60:
+        m, s = m + 1, 0
+    if m == 60:
+        d, m = d + 1, 0
+    return f"{sign}{d:0{width}d}:{m:02d}:{s:02d}"
+
+
+def format_caris_section(svp: SoundVelocityProfile):
+    """
+    CARIS SVP 文件中的一个剖面段（Section 行 + 深度/声速）
+    """
+    depth, speed = _valid_levels(svp)
+    if depth.size == 0:
+        return ''
+    t = _to_datetime(svp.time)
+    header = (f"Section {t.year:04d}-{t.timetuple().tm_yday:03d} {t:%H:%M:%S} "
+              f"{_format_dms(svp.latitude, 2)} {_format_dms(svp.longitude, 3)}\n")
+    return header + _format_levels(depth, speed)
+
+
+def format_asvp(svp: SoundVelocityProfile):
+    """
+    Kongsberg ASVP 文件内容
+    """
+    depth, speed = _valid_levels(svp)
+    if depth.size == 0:
+        return ''
+    t = _to_datetime(svp.time)
+    header = (f"( SoundVelocity  1.0 0 {t:%Y%m%d%H%M} {svp.latitude:.7f} {svp.longitude:.7f} "
+              f"-1 0 0 SvpBuilder P {depth.size} )\n")
+    return header + _format_levels(depth, speed)
+
+
+def export_caris_svp(svps: List[SoundVelocityProfile], path, chunk_size=512, workers=4):
+    """
+    将剖面集合写入一个多段 CARIS SVP 文件\n
+    :return: 写出的剖面数
+    """
+    path = Path(path)
+    count = 0
+
+    def prepare(start, chunk):
+        sections = [format_caris_section(svp) for svp in chunk]
+        return sum(1 for s in sections if s), ''.join(sections)
+
+    with open(path, 'w', encoding='ascii') as fh:
+        fh.write(f"[SVP_VERSION_2]\n{path.name}\n")
+
+        def consume(result):
+            nonlocal count
+            count += result[0]
+            fh.write(result[1])
+
+        _stream(prepare, consume, svps, chunk_size, workers)
+    return count
+
+
+def export_asvp(svps: List[SoundVelocityProfile], directory, prefix='', chunk_size=64, workers=8):
+    """
+    每个剖面写出一个 ASVP 文件，文件名为 prefix + 剖面名 + '.asvp'\n
+    :return: 写出的文件数
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    count = 0
+
+    def prepare(start, chunk):
+        written = 0
+        for svp in chunk:
+            text = format_asvp(svp)
+            if not text:
+                continue
+            with open(directory / f"{prefix}{svp.name}.asvp", 'w', encoding='ascii') as fh:
+                fh.write(text)
+            written += 1
+        return written
+
+    def consume(written):
+        nonlocal count
+        count += written
+
+    _stream(prepare, consume, svps, chunk_size, workers)
+    return count
+
+
+# 合并文件中的逐层变量：(变量名, SoundVelocityProfile 属性名, 单位)
+LEVEL_VARIABLES = [
+    ('PRES', 'pressure', 'decibar'),
+    ('TEMP', 'temperature', 'degree_Celsius'),
+    ('PSAL', 'salinity', 'psu'),
+    ('DEPTH', 'depth', 'm'),
+    ('SPEED', 'speed', 'm/s'),
+]
+
+
+def _stack_chunk(chunk, num_levels):
+    """
+    将一块剖面整理为定长数组，缺失的逐层变量填 NaN
+    """
+    arrays = {}
+    for var, attr, _ in LEVEL_VARIABLES:
+        stacked, = stack_profiles(chunk, (attr,), qc=None)
+        padded = np.full((len(chunk), num_levels), np.nan, dtype=np.float32)
+        padded[:, :stacked.shape[1]] = stacked
+        arrays[var] = padded
+
+    speed_qc = np.zeros((len(chunk), num_levels), dtype=np.int8)
+    for i, svp in enumerate(chunk):
+        n = np.size(svp.speed)
+        if n:
+            speed_qc[i, :n] = np.broadcast_to(np.asarray(svp.speed_qc, dtype=bool), (n,))
+    arrays['SPEED_QC'] = speed_qc
+
+    arrays['TIME'] = np.array([np.datetime64(svp.time, 'ns') for svp in chunk])
+    arrays['LATITUDE'] = np.array([svp.latitude for svp in chunk], dtype=float)
+    arrays['LONGITUDE'] = np.array([svp.longitude for svp in chunk], dtype=float)
+    arrays['NAME'] = np.array([svp.name for svp in chunk], dtype=object)
+    return arrays
+
+
+def _num_levels(svps):
+    return max((np.size(getattr(svp, attr)) for svp in svps for _, attr, _ in LEVEL_VARIABLES), default=0)
+
+
+def export_netcdf(svps: List[SoundVelocityProfile], path, chunk_size=4096, workers=4):
+    """
+    将剖面集合写入一个 NetCDF 文件，维度为 (N_PROF, N_LEVELS)，沿 N_PROF 逐块追加\n
+    :return: 写出的剖面数
+    """
+    num_levels = _num_levels(svps)
+    with Dataset(path, 'w') as nc:
+        nc.createDimension('N_PROF', None)
+        nc.createDimension('N_LEVELS', num_levels)
+        chunks = (min(chunk_size, max(len(svps), 1)), max(num_levels, 1))
+
+        for var, _, units in LEVEL_VARIABLES:
+            v = nc.createVariable(var, 'f4', ('N_PROF', 'N_LEVELS'), zlib=True, chunksizes=chunks,
+                                  fill_value=np.float32(np.nan))
+            v.units = units
+        nc.createVariable('SPEED_QC', 'i1', ('N_PROF', 'N_LEVELS'), zlib=True, chunksizes=chunks)
+        time_var = nc.createVariable('TIME', 'f8', ('N_PROF',))
+        time_var.units = 'seconds since 1970-01-01 00:00:00'
+        nc.createVariable('LATITUDE', 'f8', ('N_PROF',)).units = 'degree_north'
+        nc.createVariable('LONGITUDE', 'f8', ('N_PROF',)).units = 'degree_east'
+        nc.createVariable('NAME', str, ('N_PROF',))
+
+        def prepare(start, chunk):
+            return start, _stack_chunk(chunk, num_levels)
+
+        def consume(result):
+            start, arrays = result
+            sl = slice(start, start + arrays['TIME'].size)
+            for var, _, _ in LEVEL_VARIABLES:
+                nc[var][sl, :] = arrays[var]
+            nc['SPEED_QC'][sl, :] = arrays['SPEED_QC']
+            nc['TIME'][sl] = arrays['TIME'].astype('datetime64[s]').astype(np.int64)
+            nc['LATITUDE'][sl] = arrays['LATITUDE']
+            nc['LONGITUDE'][sl] = arrays['LONGITUDE']
+            nc['NAME'][sl] = arrays['NAME']
+
+        # HDF5 写入不是线程安全的，只并行整理数据，写入在主线程顺序进行
+        _stream(prepare, consume, svps, chunk_size, workers)
+    return len(svps)
+
+
+def export_zarr(svps: List[SoundVelocityProfile], path, chunk_size=4096, workers=4):
+    """
+    将剖面集合写入 Zarr 存储，每块剖面作为一个 Zarr chunk 沿 N_PROF 追加（需要安装 zarr）\n
+    :return: 写出的剖面数
+    """
+    num_levels = _num_levels(svps)
+    first = True
+
+    def prepare(start, chunk):
+        arrays = _stack_chunk(chunk, num_levels)
+        data_vars = {var: (('N_PROF', 'N_LEVELS'), arrays[var], {'units': units})
+                     for var, _, units in LEVEL_VARIABLES}
+        data_vars['SPEED_QC'] = (('N_PROF', 'N_LEVELS'), arrays['SPEED_QC'])
+        data_vars['TIME'] = ('N_PROF', arrays['TIME'])
+        data_vars['LATITUDE'] = ('N_PROF', arrays['LATITUDE'], {'units': 'degree_north'})
+        data_vars['LONGITUDE'] = ('N_PROF', arrays['LONGITUDE'], {'units': 'degree_east'})
+        # 变长字符串：定长 <U 类型由首块决定，后续块的名称更长时无法追加
+        data_vars['NAME'] = ('N_PROF', arrays['NAME'])
+        return xr.Dataset(data_vars)
+
+    def consume(ds):
+        nonlocal first
+        if first:
+            encoding = {var: {'chunks': (chunk_size, max(num_levels, 1))} for var in ds.data_vars
+                        if ds[var].ndim == 2}
+            ds.to_zarr(path, mode='w', encoding=encoding, consolidated=True)
+            first = False
+        else:
+            ds.to_zarr(path, append_dim='N_PROF', consolidated=True)
+
+    _stream(prepare, consume, svps, chunk_size, workers)
+    return len(svps)
+
+
+# 扩展名 -> 导出函数
+EXPORTERS = {
+    '.svp': export_caris_svp,
+    '.nc': export_netcdf,
+    '.zarr': export_zarr,
+}
+
+
+def export_profiles(svps: List[SoundVelocityProfile], path):
+    """
+    按扩展名选择导出格式；'.asvp' 以文件名为前缀，在同一目录下为每个剖面写出一个文件\n
+    :return: 写出的剖面数
+    """
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == '.asvp':
+        return export_asvp(svps, path.parent, prefix=path.stem + '_')
+    if suffix not in EXPORTERS:
+        raise ValueError(f"不支持的导出格式 '{suffix}'")
+    return EXPORTERS[suffix](svps, path)
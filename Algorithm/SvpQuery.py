@@ -0,0 +1,265 @@
+# 声速查询接口：任意位置、深度、时间的声速剖面 / 声速值
+# 剖面先重采样到统一深度层，查询由时空 IDW 插值给出，结果按查询键做 LRU 缓存
+# 可作为 Python API 使用，也可通过 serve() 启动本地 HTTP 服务
+
+import json
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import List
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import xarray as xr
+
+from .Interpolation import STANDARD_LEVELS, IdwInterpolator, resample_profiles
+from .SoundVelocityProfile import SoundVelocityProfile, stack_profiles
+
+
+class SoundSpeedQuery:
+    def __init__(self, latitude, longitude, time, depth, speed, levels=STANDARD_LEVELS,
+                 time_scale=10.0, k=8, power=2.0, cache_size=65536, precision=(1e-4, 1e-4, 60)):
+        """
+        :param latitude: 剖面纬度 (degree)，形状 (n_svp,)
+        :param longitude: 剖面经度 (degree)，形状 (n_svp,)
+        :param time: 剖面时间 (datetime64)，形状 (n_svp,)
+        :param depth: 剖面深度 (m)，NaN 填充，形状 (n_svp, n_level)
+        :param speed: 剖面声速 (m/s)，与 depth 同形状
+        :param levels: 统一深度层 (m)
+        :param time_scale: 时间与空间距离的换算 (km/day)
+        :param k: 参与插值的近邻剖面数
+        :param power: IDW 权重幂次
+        :param cache_size: LRU 缓存的剖面个数
+        :param precision: 缓存键的量化精度 (纬度 degree, 经度 degree, 时间 s)，查询按量化后的位置计算
+        """
+        self.levels = np.asarray(levels, dtype=float)
+        latitude = np.asarray(latitude, dtype=float)
+        longitude = np.asarray(longitude, dtype=float)
+        time = np.asarray(time, dtype='datetime64[s]')
+
+        grid = resample_profiles(depth, speed, self.levels)
+        # 全部层都缺测的剖面不参与插值
+        keep = np.isfinite(grid).any(axis=1)
+        self.interpolator = IdwInterpolator(latitude[keep], longitude[keep], time[keep], grid[keep],
+                                            time_scale, k, power)
+
+        self.precision = np.asarray(precision, dtype=float)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def fromProfiles(cls, svps: List[SoundVelocityProfile], **kwargs):
+        depth, speed = stack_profiles(svps)
+        latitude = np.array([svp.latitude for svp in svps], dtype=float)
+        longitude = np.array([svp.longitude for svp in svps], dtype=float)
+        time = np.array([np.datetime64(svp.time, 's') for svp in svps])
+        return cls(latitude, longitude, time, depth, speed, **kwargs)
+
+    @classmethod
+    def fromNetcdf(cls, path, **kwargs):
+        """
+        由 SvpExport.export_netcdf / export_zarr 导出的合并文件构造，不需要 GUI
+        """
+        ds = xr.open_zarr(path) if str(path).endswith('.zarr') else xr.open_dataset(path)
+        with ds:
+            speed = ds['SPEED'].values.astype(float)
+            speed[ds['SPEED_QC'].values == 0] = np.nan
+            return cls(ds['LATITUDE'].values, ds['LONGITUDE'].values, ds['TIME'].values,
+                       ds['DEPTH'].values, speed, **kwargs)
+
+    def _keys(self, latitude, longitude, time):
+        lat = np.round(np.atleast_1d(np.asarray(latitude, dtype=float)) / self.precision[0])
+        lon = np.round(np.atleast_1d(np.asarray(longitude, dtype=float)) / self.precision[1])
+        t = np.atleast_1d(np.asarray(time, dtype='datetime64[s]')).astype(np.int64)
+        t = np.round(t / self.precision[2])
+        lat, lon, t = np.broadcast_arrays(lat, lon, t)
+        return np.column_stack([lat, lon, t]).astype(np.int64)
+
+    def profiles(self, latitude, longitude, time):
+        """
+        批量查询声速剖面，各参数可相互广播\n
+        :return: 形状 (n_query, len(levels))，对应深度为 self.levels；位置或时间缺测 (NaN / NaT) 的查询为 NaN
+        """
+        latitude, longitude, time = [a.ravel() for a in np.broadcast_arrays(
+            np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float),
+            np.asarray(time, dtype='datetime64[s]'))]
+        # 位置或时间缺测的查询结果为 NaN，不参与插值和缓存
+        valid = np.isfinite(latitude) & np.isfinite(longitude) & ~np.isnat(time)
+        result = np.full((latitude.size, self.levels.size), np.nan)
+        if not valid.any():
+            return result
+
+        keys = self._keys(latitude[valid], longitude[valid], time[valid])
+        uniq, inv = np.unique(keys, axis=0, return_inverse=True)
+        inv = inv.ravel()
+        out = np.empty((uniq.shape[0], self.levels.size))
+
+        missing = []
+        with self._lock:
+            for i, key in enumerate(map(tuple, uniq.tolist())):
+                cached = self._cache.get(key)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(key)
+                    out[i] = cached
+            self.hits += uniq.shape[0] - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            q = uniq[missing]
+            lat = q[:, 0] * self.precision[0]
+            lon = q[:, 1] * self.precision[1]
+            t = (q[:, 2] * self.precision[2]).astype('datetime64[s]')
+            out[missing] = self.interpolator(lat, lon, t)
+
+            with self._lock:
+                for i in missing:
+                    self._cache[tuple(uniq[i].tolist())] = out[i].copy()
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        result[valid] = out[inv]
+        return result
+
+    def profile(self, latitude, longitude, time):
+        """
+        查询单个声速剖面\n
+        :return: (levels, speed)
+        """
+        return self.levels, self.profiles(latitude, longitude, time)[0]
+
+    def speed(self, latitude, longitude, depth, time):
+        """
+        批量查询任意深度处的声速，各参数可相互广播\n
+        :return: 声速 (m/s)，超出剖面深度范围处为 NaN
+        """
+        latitude, longitude, depth, time = np.broadcast_arrays(
+            np.asarray(latitude, dtype=float), np.asarray(longitude, dtype=float),
+            np.asarray(depth, dtype=float), np.asarray(time, dtype='datetime64[s]'))
+        shape = depth.shape
+        grid = self.profiles(latitude.ravel(), longitude.ravel(), time.ravel())
+        # 在各自的剖面上插值到查询深度
+        out = _interp_rows(self.levels, grid, depth.ravel())
+        return out.reshape(shape)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _interp_rows(levels, grid, depth):
+    """
+    grid 的每行在 levels 上插值到对应的一个深度
+    """
+    right = np.searchsorted(levels, depth, side='right')
+    lo = np.clip(right - 1, 0, levels.size - 1)
+    hi = np.clip(right, 0, levels.size - 1)
+    rows = np.arange(depth.size)
+    z0, z1 = levels[lo], levels[hi]
+    v0, v1 = grid[rows, lo], grid[rows, hi]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(z1 > z0, v0 + (depth - z0) / (z1 - z0) * (v1 - v0), v0)
+    return np.where((right >= 1) & ((right < levels.size) | (depth == z0)), out, np.nan)
+
+
+def _tolist(a):
+    # JSON 不支持 NaN，缺测值输出为 null
+    return np.where(np.isfinite(a), a, None).tolist()
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET  /profile?lat=..&lon=..&time=..          -> {"depth": [...], "speed": [...]}
+    GET  /speed?lat=..&lon=..&depth=..&time=..   -> {"speed": ...}
+    POST /profiles {"lat": [...], "lon": [...], "time": [...]}             -> {"depth": [...], "speed": [[...], ...]}
+    POST /speed    {"lat": [...], "lon": [...], "depth": [...], "time": [...]} -> {"speed": [...]}
+    时间为 ISO 8601 字符串
+    """
+    query: SoundSpeedQuery = None
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, path, args):
+        if path not in ('/profile', '/profiles', '/speed'):
+            self._reply(404, {'error': f"unknown path {path}"})
+            return
+        try:
+            lat = np.asarray(args['lat'], dtype=float)
+            lon = np.asarray(args['lon'], dtype=float)
+            time = np.asarray(args['time'], dtype='datetime64[s]')
+            if path == '/profile' and (lat.ndim or lon.ndim or time.ndim):
+                raise ValueError("/profile expects scalar lat, lon and time, use /profiles for lists")
+            if path == '/speed':
+                speed = self.query.speed(lat, lon, np.asarray(args['depth'], dtype=float), time)
+                body = {'speed': _tolist(speed)}
+            else:
+                speed = self.query.profiles(lat, lon, time)
+                body = {'depth': self.query.levels.tolist(),
+                        'speed': _tolist(speed[0] if path == '/profile' else speed)}
+        except KeyError as e:
+            self._reply(400, {'error': f"missing parameter {e}"})
+            return
+        except (ValueError, TypeError) as e:
+            # TypeError：参数类型不对，如 {"lat": {"a": 1}} 或请求体不是 JSON 对象
+            self._reply(400, {'error': str(e)})
+            return
+        except Exception as e:
+            # 其他异常也要回复，不能让连接无响应地断开
+            self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+            return
+        self._reply(200, body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        args = {key: value[0] for key, value in parse_qs(url.query).items()}
+        self._handle(url.path, args)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            args = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError as e:
+            # 含 JSONDecodeError、非 UTF-8 请求体和无效的 Content-Length
+            self._reply(400, {'error': str(e)})
+            return
+        self._handle(url.path, args)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(query: SoundSpeedQuery, host='127.0.0.1', port=8765):
+    """
+    启动本地 HTTP 查询服务（阻塞），返回前需 Ctrl+C 或在其他线程调用 server.shutdown()
+    """
+    handler = type('QueryHandler', (_QueryHandler,), {'query': query})
+    server = ThreadingHTTPServer((host, port), handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SvpBuilder sound speed query server")
+    parser.add_argument('path', help="SvpExport 导出的 NetCDF / Zarr 文件")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    serve(SoundSpeedQuery.fromNetcdf(args.path), args.host, args.port)
@@ -0,0 +1,86 @@
+# 导出 -> 读回检查：合成剖面分块写出 NetCDF 与 Zarr，再由查询服务和气候态读回核对
+# 用法：python export_roundtrip.py [输出目录]，未指定目录时写到临时目录；有不一致时以非零状态退出
+
+import sys
+import tempfile
+from importlib.util import find_spec
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from Algorithm.Climatology import ClimatologyBuilder
+from Algorithm.SoundVelocityProfile import SoundVelocityProfile, preprocess_profiles
+from Algorithm.SvpExport import EXPORTERS
+from Algorithm.SvpQuery import SoundSpeedQuery
+
+
+def synthetic_profiles(num_svps, seed=0):
+    """
+    合成剖面，名称长度跨过 stem(9999) -> stem(10000)，用于检查分块追加时的变长名称
+    """
+    rng = np.random.default_rng(seed)
+    svps = []
+    for i in range(num_svps):
+        svp = SoundVelocityProfile()
+        svp.name = f"roundtrip({i})"
+        svp.time = np.datetime64('2023-01-01') + np.timedelta64(i % 365, 'D')
+        svp.latitude, svp.longitude = rng.uniform(-60, 60), rng.uniform(-180, 180)
+        svp.position_qc = svp.pres_qc = svp.temp_qc = svp.sali_qc = True
+        svp.pressure = np.arange(5.0, 1005.0, 10.0)
+        svp.temperature = 25.0 - 20.0 * (1.0 - np.exp(-svp.pressure / 300.0))
+        svp.salinity = np.full(svp.pressure.shape, 35.0)
+        svps.append(svp)
+    preprocess_profiles(svps)
+    return svps
+
+
+def check_file(path, svps):
+    """
+    :return: 不一致项的说明列表，为空表示读回一致
+    """
+    errors = []
+    ds = xr.open_zarr(path) if path.suffix == '.zarr' else xr.open_dataset(path)
+    with ds:
+        names = ds['NAME'].values.tolist()
+        if len(names) != len(svps) or str(names[-1]) != svps[-1].name:
+            errors.append(f"NAME 读回不一致：{len(names)} 个，最后一个为 {names[-1] if names else None!r}")
+        if not np.allclose(ds['SPEED'].values[-1], svps[-1].speed, atol=1e-3, equal_nan=True):
+            errors.append("SPEED 读回不一致")
+
+    query = SoundSpeedQuery.fromNetcdf(path)
+    speed = query.speed(svps[0].latitude, svps[0].longitude, 500.0, svps[0].time)
+    if not np.isfinite(speed):
+        errors.append("SoundSpeedQuery 查询结果为 NaN")
+    builder = ClimatologyBuilder()
+    builder.add_file(path)
+    if builder.num_profiles != len(svps):
+        errors.append(f"ClimatologyBuilder 读回 {builder.num_profiles} 个剖面，应为 {len(svps)}")
+    return errors
+
+
+def roundtrip(directory, num_svps=12000, chunk_size=4096):
+    """
+    :return: {路径: 不一致项列表}
+    """
+    svps = synthetic_profiles(num_svps)
+    directory = Path(directory)
+    suffixes = ['.nc'] + (['.zarr'] if find_spec('zarr') is not None else [])
+    results = {}
+    for suffix in suffixes:
+        path = directory / f'roundtrip{suffix}'
+        EXPORTERS[suffix](svps, path, chunk_size=chunk_size)
+        results[path] = check_file(path, svps)
+    return results
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        results = roundtrip(sys.argv[1] if len(sys.argv) > 1 else tmp)
+    failed = False
+    for path, errors in results.items():
+        print(f"{path.suffix}: {'round-trip OK' if not errors else 'FAILED'} ({path})")
+        for error in errors:
+            print(f"  {error}")
+        failed |= bool(errors)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,296 @@
+import math
+
+import numpy as np
+import pyqtgraph as pg
+import pyqtgraph.opengl as gl
+from PyQt6.QtCore import QObject, QThread, pyqtSignal
+
+
+# 后台线程中按细节层次由粗到细提取等值面，每层按 x 方向分块，每块完成后立即发给界面
+class IsosurfaceWorker(QObject):
+    chunk_ready = pyqtSignal(int, object, object)
+    stage_finished = pyqtSignal(int)
+    finished = pyqtSignal(bool)
+
+    def __init__(self, stages, level, chunk_size=16):
+        """
+        :param stages: [(lod, volume), ...]，按由粗到细的顺序提取
+        """
+        super().__init__()
+        self.stages = stages
+        self.level = level
+        self.chunk_size = chunk_size
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        for stage, (_, volume) in enumerate(self.stages):
+            nx = volume.shape[0]
+            for start in range(0, nx - 1, self.chunk_size):
+                if self._cancelled:
+                    break
+                # 相邻块重叠一层，保证跨块的体素也被处理
+                slab = volume[start:start + self.chunk_size + 1]
+                verts, faces = pg.isosurface(slab, self.level)
+                if len(faces) > 0:
+                    verts = np.asarray(verts, dtype=np.float32)
+                    verts[:, 0] += start
+                    self.chunk_ready.emit(stage, verts, np.asarray(faces))
+            if self._cancelled:
+                break
+            self.stage_finished.emit(stage)
+        self.finished.emit(not self._cancelled)
+
+
+# 后台线程中计算声速体（重采样和网格插值），避免大网格阻塞界面
+class VolumeBuilder(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, build):
+        """
+        :param build: 无参函数，返回 (volume, origin, spacing)
+        """
+        super().__init__()
+        self.build = build
+
+    def run(self):
+        try:
+            result = self.build()
+        except (ValueError, MemoryError) as e:
+            self.failed.emit(str(e) or type(e).__name__)
+            return
+        self.finished.emit(result)
+
+
+def budget_lod(shape, max_voxels):
+    """
+    满足体素预算的最小抽稀步长：各方向每 lod 个网格点取一个后，体素数不超过 max_voxels
+    """
+    lod = max(1, math.ceil((np.prod(shape) / max_voxels) ** (1.0 / 3.0)))
+    while np.prod([math.ceil(n / lod) for n in shape]) > max_voxels:
+        lod += 1
+    return lod
+
+
+class VolumeRenderer(QObject):
+    """
+    在 GLViewWidget 中显示规则网格声速体：GLVolumeItem 切片渲染和等值面\n
+    网格点 (i, j, k) 的显示坐标为 origin + (i, j, k) * spacing\n
+    细节层次：显示所用的抽稀步长由体素预算 max_voxels 决定；等值面先在预览预算 preview_voxels 下
+    提取粗网格并立即显示，再在后台提取显示精度的网格，完成后替换粗网格
+    """
+    build_failed = pyqtSignal(str)
+
+    def __init__(self, gl_view, cmap, max_voxels=64 ** 3, preview_voxels=24 ** 3):
+        super().__init__()
+        self.gl_view = gl_view
+        self.cmap = cmap
+        self.max_voxels = max_voxels
+        self.preview_voxels = preview_voxels
+
+        self.full_volume = None
+        self.volume = None
+        self.origin = np.zeros(3)
+        self.base_spacing = np.ones(3)
+        self.lod = 1
+
+        self.items = []
+        # (等值, lod) -> [(verts, faces), ...]，只保存完整提取的结果
+        self.mesh_cache = {}
+        self._pending = None
+        self._thread = None
+        self._worker = None
+        self._build_thread = None
+        self._builder = None
+        self._on_ready = None
+        # 已放弃但仍在运行的计算线程，结束前需保留引用
+        self._retired = []
+
+    @property
+    def building(self):
+        return self._builder is not None
+
+    def load_volume(self, build, on_ready=None):
+        """
+        在后台线程中计算声速体，完成后 set_volume 并调用 on_ready；计算失败时发出 build_failed\n
+        :param build: 无参函数，返回 (volume, origin, spacing)
+        :param on_ready: 无参回调，在界面线程中调用
+        """
+        self.reset()
+        self._on_ready = on_ready
+        self._build_thread = QThread()
+        self._builder = VolumeBuilder(build)
+        self._builder.moveToThread(self._build_thread)
+        self._build_thread.started.connect(self._builder.run)
+        self._builder.finished.connect(self.on_volume_built)
+        self._builder.failed.connect(self.on_build_failed)
+        self._builder.finished.connect(self._build_thread.quit)
+        self._builder.failed.connect(self._build_thread.quit)
+        self._build_thread.start()
+
+    def on_volume_built(self, result):
+        if self.sender() is not self._builder:
+            return
+        on_ready = self._on_ready
+        self._finish_build()
+        self.set_volume(*result)
+        if on_ready is not None:
+            on_ready()
+
+    def on_build_failed(self, message):
+        if self.sender() is not self._builder:
+            return
+        self._finish_build()
+        self.build_failed.emit(message)
+
+    def _finish_build(self):
+        # 不等待线程结束，避免界面阻塞；已放弃的结果由 sender 检查忽略
+        if self._build_thread is not None:
+            self._build_thread.quit()
+            self._retired.append((self._build_thread, self._builder))
+            self._build_thread.finished.connect(self._reap)
+        self._build_thread = None
+        self._builder = None
+        self._on_ready = None
+
+    def _reap(self):
+        self._retired = [(thread, builder) for thread, builder in self._retired if not thread.isFinished()]
+
+    def reset(self):
+        self._finish_build()
+        self.cancel()
+        self.clear()
+        self.mesh_cache.clear()
+        self.full_volume = None
+        self.volume = None
+
+    def set_volume(self, volume, origin, spacing):
+        self.reset()
+        self.full_volume = np.asarray(volume, dtype=np.float32)
+        self.origin = np.asarray(origin, dtype=float)
+        self.base_spacing = np.asarray(spacing, dtype=float)
+        self.lod = budget_lod(self.full_volume.shape, self.max_voxels)
+        self.volume = self.strided(self.lod)
+
+    def strided(self, lod):
+        return self.full_volume[::lod, ::lod, ::lod]
+
+    def _place(self, item, lod):
+        item.scale(*(self.base_spacing * lod))
+        item.translate(*self.origin)
+        self.gl_view.addItem(item)
+        self.items.append(item)
+
+    def clear(self):
+        for item in self.items:
+            if item in self.gl_view.items:
+                self.gl_view.removeItem(item)
+        self.items = []
+
+    def show_slices(self, alpha=40):
+        """
+        以半透明切片渲染整个声速体
+        """
+        self.cancel()
+        self.clear()
+        if self.volume is None:
+            return
+        v_min, v_max = np.nanmin(self.volume), np.nanmax(self.volume)
+        norm = (self.volume - v_min) / max(v_max - v_min, 1e-9)
+        rgba = self.cmap.map(np.nan_to_num(norm).ravel(), mode='byte').reshape(self.volume.shape + (4,))
+        rgba[..., 3] = np.where(np.isfinite(self.volume), alpha, 0)
+        self._place(gl.GLVolumeItem(np.ascontiguousarray(rgba), sliceDensity=2, smooth=True), self.lod)
+
+    def show_isosurface(self, level, chunk_size=16):
+        """
+        显示等值面；已缓存的等值直接显示，否则在后台线程中先粗后细分块提取
+        """
+        self.cancel()
+        self.clear()
+        if self.volume is None:
+            return
+        level = float(level)
+        key = (level, self.lod)
+        if key in self.mesh_cache:
+            for verts, faces in self.mesh_cache[key]:
+                self._add_mesh(level, verts, faces, self.lod)
+            return
+
+        lods = [self.lod]
+        preview = budget_lod(self.full_volume.shape, self.preview_voxels)
+        if preview > self.lod and min(math.ceil(n / preview) for n in self.full_volume.shape) >= 2:
+            lods.insert(0, preview)
+        # 缺测网格点取最大值，视为等值面外侧
+        fill = np.nanmax(self.full_volume)
+        stages = []
+        for lod in lods:
+            if (level, lod) in self.mesh_cache:
+                continue
+            volume = self.strided(lod)
+            stages.append((lod, np.where(np.isfinite(volume), volume, fill)))
+        # 粗网格已缓存时先显示，只在后台提取细网格
+        cached = len(stages) < len(lods)
+        if cached:
+            for verts, faces in self.mesh_cache[(level, lods[0])]:
+                self._add_mesh(level, verts, faces, lods[0])
+
+        # 每一层：[lod, 已提取的块, 是否边提取边显示]；第一层没有可显示的粗网格时逐块显示，其余层完成后整体替换
+        self._pending = (level, [[lod, [], i == 0 and not cached] for i, (lod, _) in enumerate(stages)])
+        self._thread = QThread()
+        self._worker = IsosurfaceWorker(stages, level, chunk_size)
+        self._worker.moveToThread(self._thread)
+        self._thread.started.connect(self._worker.run)
+        self._worker.chunk_ready.connect(self.on_chunk_ready)
+        self._worker.stage_finished.connect(self.on_stage_finished)
+        self._worker.finished.connect(self.on_finished)
+        self._worker.finished.connect(self._thread.quit)
+        self._thread.start()
+
+    def _add_mesh(self, level, verts, faces, lod):
+        v_min, v_max = np.nanmin(self.volume), np.nanmax(self.volume)
+        color = self.cmap.map(np.array([(level - v_min) / max(v_max - v_min, 1e-9)]), mode='float')[0]
+        mesh = gl.GLMeshItem(vertexes=verts, faces=faces, color=tuple(color), smooth=True,
+                             shader='shaded', glOptions='opaque')
+        self._place(mesh, lod)
+        return mesh
+
+    def on_chunk_ready(self, stage, verts, faces):
+        # 忽略已取消的任务在队列中残留的信号
+        if self._pending is None or self.sender() is not self._worker:
+            return
+        level, stages = self._pending
+        lod, chunks, progressive = stages[stage]
+        chunks.append((verts, faces))
+        if progressive:
+            self._add_mesh(level, verts, faces, lod)
+
+    def on_stage_finished(self, stage):
+        if self._pending is None or self.sender() is not self._worker:
+            return
+        level, stages = self._pending
+        lod, chunks, progressive = stages[stage]
+        self.mesh_cache[(level, lod)] = chunks
+        if progressive:
+            return
+        # 细网格完成：替换当前显示的粗网格
+        self.clear()
+        for verts, faces in chunks:
+            self._add_mesh(level, verts, faces, lod)
+
+    def on_finished(self, complete):
+        if self.sender() is not self._worker:
+            return
+        self._pending = None
+
+    def cancel(self):
+        if self._worker is not None:
+            self._worker.cancel()
+        if self._thread is not None:
+            self._thread.quit()
+            self._thread.wait()
+        self._worker = None
+        self._thread = None
+        self._pending = None
@@ -1,11 +1,13 @@
 from datetime import timezone
+from pathlib import Path
 
 import numpy as np
 from PyQt6.QtWidgets import QMainWindow, QMenuBar, QMenu, QWidget, QVBoxLayout, QHBoxLayout, QListView, QTableView, \
-    QPushButton, QFileDialog
+    QPushButton, QFileDialog, QMessageBox
 from PyQt6.QtGui import QGuiApplication, QAction, QStandardItemModel, QStandardItem
 from PyQt6.QtCore import Qt, QDir, QAbstractTableModel, QModelIndex, pyqtSignal
 from Algorithm.argoreader import SeaSoundField
+from Algorithm.CsvReader import read_profile_csv
 import xarray as xr
 
 
@@ -86,7 +88,15 @@ class Ui_ArgoForm(QWidget):
         file_paths,_ = QFileDialog.getOpenFileNames(self, "Select Argo data file(s)", r"D:\MBdata\DataSelection_804fac33", "NetCDF(*.nc);;CSV(*.csv)")
         if file_paths:
             for file_path in file_paths:
-                ds = xr.open_dataset(file_path)
+                # CSV 按块读取并分组为与 Argo NetCDF 相同布局的 Dataset
+                if Path(file_path).suffix.lower() == '.csv':
+                    try:
+                        ds = read_profile_csv(file_path)
+                    except ValueError as e:
+                        QMessageBox.warning(self, "CSV", f"{file_path}\n{e}")
+                        continue
+                else:
+                    ds = xr.open_dataset(file_path)
                 self.data.append(ds)
                 item = QStandardItem(file_path)
                 self.list_model.appendRow(item)
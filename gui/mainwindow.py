@@ -1,21 +1,54 @@
 import io
+import re
+from importlib.util import find_spec
+from pathlib import Path
 
 import folium
 import numpy as np
 from PyQt6.QtWidgets import QMainWindow, QMenuBar, QMenu, QListView, QPushButton, QRadioButton, QButtonGroup, \
-    QVBoxLayout, QHBoxLayout, QSpacerItem, QWidget
+    QVBoxLayout, QHBoxLayout, QSpacerItem, QWidget, QFileDialog, QInputDialog, QTableView, QComboBox, QLineEdit, \
+    QAbstractItemView, QMessageBox
 from PyQt6.QtGui import QGuiApplication, QAction, QStandardItemModel, QStandardItem
+from PyQt6.QtCore import Qt, QSortFilterProxyModel
 import pyqtgraph as pg
 # from PyQt6.QtWebEngineWidgets import QWebEngineView
 from PyQt6.QtWebEngineWidgets import QWebEngineView
 
 from .PlotSetting import CustomYAxis, CustomAxis
 from .argoform import Ui_ArgoForm
-from Algorithm.SoundVelocityProfile import SoundVelocityProfile
+from .VolumeView import VolumeRenderer
+from Algorithm.SoundVelocityProfile import SoundVelocityProfile, stack_profiles, preprocess_profiles
+from Algorithm.SoundSpeedModels import MODELS
+from Algorithm.Interpolation import resample_profiles, volume_shape, grid_volume
+from Algorithm.SvpExport import export_profiles
+from Algorithm.Uncertainty import propagate_profiles
+from Algorithm.AcousticFeatures import FEATURES, extract_features
 import pyqtgraph.opengl as gl
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 
+
+# 按某一特征列的取值范围筛选剖面，数值保存在 UserRole 中
+class FeatureFilterProxy(QSortFilterProxyModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.range_column = -1
+        self.range = (-np.inf, np.inf)
+
+    def set_range(self, column, lower=-np.inf, upper=np.inf):
+        self.range_column = column
+        self.range = (lower, upper)
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.range_column < 0:
+            return True
+        value = self.sourceModel().index(source_row, self.range_column, source_parent).data(Qt.ItemDataRole.UserRole)
+        if value is None:
+            return False
+        return self.range[0] <= value <= self.range[1]
+
+
 class Ui_MainWindow(QMainWindow):
 
     svps = []
@@ -46,9 +79,35 @@ class Ui_MainWindow(QMainWindow):
         dataMenu.addAction(argoAct)
         argoAct.triggered.connect(self.on_argoAct_triggered)
 
+        exportAct = QAction('Export', self)
+        dataMenu.addAction(exportAct)
+        exportAct.triggered.connect(self.on_exportAct_triggered)
+
+        viewMenu = menubar.addMenu('View')
+
+        volumeAct = QAction('Volume', self)
+        viewMenu.addAction(volumeAct)
+        volumeAct.triggered.connect(self.on_volumeAct_triggered)
+
+        isoAct = QAction('Isosurface', self)
+        viewMenu.addAction(isoAct)
+        isoAct.triggered.connect(self.on_isoAct_triggered)
+
         # 设置其他窗口控件
         # 折线绘制
-        self.svp_listView = QListView()
+        self.svp_tableView = QTableView()
+        self.svp_tableView.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.svp_tableView.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.svp_tableView.setSortingEnabled(True)
+        self.svp_tableView.verticalHeader().hide()
+
+        # 特征选择：用于范围筛选和地图着色
+        self.feature_box = QComboBox()
+        self.feature_box.addItem("None")
+        for label, unit in FEATURES.values():
+            self.feature_box.addItem(f"{label} ({unit})")
+        self.range_edit = QLineEdit()
+        self.range_edit.setPlaceholderText("min:max")
         self.svp_plot = pg.PlotWidget(axisItems={'top': CustomAxis(orientation='top'),
                                                  'left': CustomAxis(orientation='left')})
         self.set_plot_axes()
@@ -66,6 +125,10 @@ class Ui_MainWindow(QMainWindow):
         self.btn_grp.addButton(self.sv_btn, 2)
         self.sv_btn.setChecked(True)
 
+        # 声速公式选择：导入时已计算全部公式，切换时不需要重新导入
+        self.model_box = QComboBox()
+        self.model_box.addItems(list(MODELS))
+
         # 地图显示
         self.webview = QWebEngineView()
         self.show_map()
@@ -73,6 +136,9 @@ class Ui_MainWindow(QMainWindow):
         # 三维显示
         self.gl_view = gl.GLViewWidget()
         self.gl_view.opts['distance'] = 4
+        self.view_norm = None
+        self.volume_renderer = VolumeRenderer(self.gl_view, self.cmap)
+        self.volume_renderer.build_failed.connect(self.on_volume_failed)
         self.colorbar = pg.ColorBarItem(values=(0, 1), colorMap=self.cmap)
         self.colorbar_widget = pg.GraphicsLayoutWidget()
         self.colorbar_widget.addItem(self.colorbar)
@@ -83,6 +149,7 @@ class Ui_MainWindow(QMainWindow):
         self.h_layout_1.addWidget(self.sali_btn)
         self.h_layout_1.addWidget(self.sv_btn)
         self.h_layout_1.addStretch()
+        self.h_layout_1.addWidget(self.model_box)
 
         self.v_layout_1 = QVBoxLayout()
         self.v_layout_1.addWidget(self.svp_plot)
@@ -96,8 +163,16 @@ class Ui_MainWindow(QMainWindow):
         self.v_layout_2.addWidget(self.webview,1)
         self.v_layout_2.addLayout(self.h_layout_3,1)
 
+        self.h_layout_4 = QHBoxLayout()
+        self.h_layout_4.addWidget(self.feature_box)
+        self.h_layout_4.addWidget(self.range_edit)
+
+        self.v_layout_3 = QVBoxLayout()
+        self.v_layout_3.addLayout(self.h_layout_4)
+        self.v_layout_3.addWidget(self.svp_tableView)
+
         self.h_layout_2 = QHBoxLayout()
-        self.h_layout_2.addWidget(self.svp_listView, 1)
+        self.h_layout_2.addLayout(self.v_layout_3, 1)
         self.h_layout_2.addLayout(self.v_layout_2, 3)
         self.h_layout_2.addLayout(self.v_layout_1, 2)
 
@@ -108,35 +183,137 @@ class Ui_MainWindow(QMainWindow):
         self.setCentralWidget(self.center_widget)
 
         self.svp_model = QStandardItemModel()
-        self.svp_listView.setModel(self.svp_model)
-
-        self.svp_listView.clicked.connect(self.on_svpItem_clicked)
+        self.svp_model.setHorizontalHeaderLabels(['Name'] + [f"{label} ({unit})" for label, unit in FEATURES.values()])
+        self.svp_proxy = FeatureFilterProxy(self)
+        self.svp_proxy.setSourceModel(self.svp_model)
+        self.svp_proxy.setSortRole(Qt.ItemDataRole.UserRole)
+        self.svp_tableView.setModel(self.svp_proxy)
+
+        self.svp_tableView.clicked.connect(self.on_svpItem_clicked)
+        self.feature_box.currentIndexChanged.connect(self.on_feature_changed)
+        self.range_edit.editingFinished.connect(self.apply_feature_filter)
         self.btn_grp.buttonClicked.connect(self.on_radioBtn_clicked)
+        self.model_box.currentTextChanged.connect(self.on_model_changed)
 
 
     def on_argoAct_triggered(self):
         self.argoForm.show()
 
+    def on_exportAct_triggered(self):
+        if not self.svps:
+            return
+        filters = ["CARIS SVP(*.svp)", "Kongsberg ASVP(*.asvp)", "NetCDF(*.nc)"]
+        # zarr 为可选依赖，未安装时不提供该格式
+        if find_spec('zarr') is not None:
+            filters.append("Zarr(*.zarr)")
+        file_path, selected = QFileDialog.getSaveFileName(self, "Export sound velocity profiles", "",
+                                                          ";;".join(filters))
+        if not file_path:
+            return
+        # 输入的文件名没有扩展名时，按所选格式补上
+        suffix = re.search(r"\*(\.\w+)", selected)
+        if not Path(file_path).suffix and suffix:
+            file_path += suffix.group(1)
+        try:
+            count = export_profiles(self.svps, file_path)
+        except (ValueError, ImportError, OSError) as e:
+            QMessageBox.warning(self, "Export", f"{file_path}\n{e}")
+            return
+        self.statusBar().showMessage(f"{count} profiles exported to {file_path}")
+
     # ArgoForm导入后触发
     def receive_data(self, data):
+        new_svps = []
         for ds in data:
             for i in range(ds.sizes['TIME']):
                 svp = SoundVelocityProfile()
                 svp.fromDatasetAt(ds, i)
-                svp.preprocess()
-                self.svps.append(svp)
-                item = QStandardItem(svp.name)
-                self.svp_model.appendRow(item)
+                new_svps.append(svp)
+
+        # 一次计算全部声速公式，当前选择的公式作为 speed
+        model = self.model_box.currentText()
+        preprocess_profiles(new_svps, model, list(MODELS))
+        # 声速不确定度（线性化传播），用于剖面图中的误差带
+        propagate_profiles(new_svps, model)
+        # 声学特征，作为列表的列
+        extract_features(new_svps)
+        for svp in new_svps:
+            self.svp_model.appendRow(self.feature_row(svp))
+        self.svps.extend(new_svps)
 
         self.show_map()
+        self.volume_renderer.reset()
         self.show_3d_pnt()
 
 
+    # 列表中的一行：剖面名和各声学特征
+    def feature_row(self, svp):
+        name = QStandardItem(svp.name)
+        name.setData(svp.name, Qt.ItemDataRole.UserRole)
+        row = [name]
+        for key in FEATURES:
+            value = svp.features.get(key, np.nan)
+            item = QStandardItem()
+            if np.isfinite(value):
+                item.setText(f"{value:.1f}")
+                item.setData(value, Qt.ItemDataRole.UserRole)
+            row.append(item)
+        return row
+
+    def on_feature_changed(self, index):
+        self.apply_feature_filter()
+        self.show_map()
+
+    # 按 "min:max" 筛选当前特征，任一端留空表示不限
+    def apply_feature_filter(self):
+        column = self.feature_box.currentIndex()
+        text = self.range_edit.text().strip()
+        if column == 0 or not text:
+            self.svp_proxy.set_range(-1)
+            return
+        try:
+            lower, upper = [float(v) if v.strip() else sign * np.inf
+                            for v, sign in zip(text.split(':', 1), (-1, 1))]
+        except ValueError:
+            self.statusBar().showMessage(f"无效的范围 '{text}'，应为 min:max")
+            return
+        self.svp_proxy.set_range(column, lower, upper)
+
+    # 切换声速公式：使用导入时已算好的结果，更新误差带、特征和显示
+    def on_model_changed(self, model):
+        svps = [svp for svp in self.svps if model in svp.speeds]
+        if not svps:
+            return
+        for svp in svps:
+            svp.speed = svp.speeds[model]
+        propagate_profiles(svps, model)
+        extract_features(svps)
+        self.svp_model.removeRows(0, self.svp_model.rowCount())
+        for svp in self.svps:
+            self.svp_model.appendRow(self.feature_row(svp))
+
+        self.show_map()
+        self.volume_renderer.reset()
+        self.show_3d_pnt()
+        if self.cur_index >= 0:
+            self.on_radioBtn_clicked(self.btn_grp.checkedButton())
+
     def on_svpItem_clicked(self, index):
-        self.cur_index = index.row()
+        self.cur_index = self.svp_proxy.mapToSource(index).row()
         svp = self.svps[self.cur_index]
         self.svp_plot.clear()
-        self.svp_plot.plot(svp.speed, -1.0*svp.pressure)
+        self.plot_speed_band(svp)
+        self.svp_plot.plot(svp.speed, -1.0*svp.depth)
+
+    # 绘制声速不确定度区间
+    def plot_speed_band(self, svp):
+        if svp.speed_lower.size == 0 or svp.speed_lower.size != svp.depth.size:
+            return
+        depth = -1.0*svp.depth
+        pen = pg.mkPen((100, 150, 255, 120))
+        lower = self.svp_plot.plot(svp.speed_lower, depth, pen=pen, connect='finite')
+        upper = self.svp_plot.plot(svp.speed_upper, depth, pen=pen, connect='finite')
+        self.svp_plot.addItem(pg.FillBetweenItem(lower, upper, brush=(100, 150, 255, 60)))
 
     # 设置声速曲线的坐标轴
     def set_plot_axes(self):
@@ -156,7 +333,7 @@ class Ui_MainWindow(QMainWindow):
         self.svp_plot.clear()
         if self.cur_index < 0:
             return
-        v_axis_data = -1.0*self.svps[self.cur_index].pressure
+        v_axis_data = -1.0*self.svps[self.cur_index].depth
         match self.btn_grp.id(button):
             case 0:
                 self.svp_plot.getPlotItem().setLabel('top', '温度', units='°C')
@@ -167,6 +344,7 @@ class Ui_MainWindow(QMainWindow):
             case 2:
                 self.svp_plot.getPlotItem().setLabel('top', '声速', units='m/s')
                 h_axis_data = self.svps[self.cur_index].speed
+                self.plot_speed_band(self.svps[self.cur_index])
             case _:
                 self.svp_plot.getPlotItem().setLabel('top', '声速', units='m/s')
                 h_axis_data = self.svps[self.cur_index].speed
@@ -193,11 +371,33 @@ class Ui_MainWindow(QMainWindow):
         center_lat = (lat_min + lat_max)/2.0
         center_lon = (lon_min + lon_max)/2.0
         m = folium.Map(location=[center_lat, center_lon], zoom_start=4)
-        for svp in self.svps:
-            folium.Marker(
-                location=[svp.latitude, svp.longitude],
-                popup=svp.name
-            ).add_to(m)
+        column = self.feature_box.currentIndex()
+        if column == 0 or not self.svps:
+            for svp in self.svps:
+                folium.Marker(
+                    location=[svp.latitude, svp.longitude],
+                    popup=svp.name
+                ).add_to(m)
+        else:
+            # 按所选特征着色，缺失值为灰色
+            key = list(FEATURES)[column - 1]
+            label, unit = FEATURES[key]
+            values = np.array([svp.features.get(key, np.nan) for svp in self.svps], dtype=float)
+            finite = np.isfinite(values)
+            v_min = values[finite].min() if finite.any() else 0.0
+            v_max = values[finite].max() if finite.any() else 1.0
+            norm = (values - v_min) / max(v_max - v_min, 1e-9)
+            colors = self.cmap.map(np.nan_to_num(norm), mode='byte')
+            for svp, value, ok, color in zip(self.svps, values, finite, colors):
+                hex_color = mcolors.to_hex(color[:3] / 255.0) if ok else '#808080'
+                folium.CircleMarker(
+                    location=[svp.latitude, svp.longitude],
+                    radius=6,
+                    color=hex_color,
+                    fill=True,
+                    fill_opacity=0.8,
+                    popup=f"{svp.name}<br>{label}: {value:.1f} {unit}" if ok else svp.name
+                ).add_to(m)
 
         data = io.BytesIO()
         m.save(data, close_file=False)
@@ -241,6 +441,7 @@ class Ui_MainWindow(QMainWindow):
         pnts[:,0] = (pnts[:,0]-x_o)/l_max
         pnts[:,1] = (pnts[:,1]-y_o)/l_max
         pnts[:,2] = (pnts[:,2]-z_o)/d_max
+        self.view_norm = (x_o, y_o, z_o, l_max, d_max)
 
         # 设置颜色
         v_min = vals.min()
@@ -259,3 +460,75 @@ class Ui_MainWindow(QMainWindow):
         # 显示
         svp_item = gl.GLScatterPlotItem(pos=pnts, color=colors, size=2)
         self.gl_view.addItem(svp_item)
+
+    # 将剖面插值为规则网格声速体，显示坐标与 show_3d_pnt 的归一化一致
+    def build_volume(self, on_ready=None, depth_step=10.0, shape=None):
+        """
+        将有效剖面插值为规则网格声速体，重采样和网格插值在后台线程中进行，完成后调用 on_ready；
+        网格大小默认由剖面数量、分布范围和最大深度决定，且不超过三维显示的体素预算\n
+        :param on_ready: 声速体就绪后在界面线程中调用的无参函数
+        :param depth_step: 垂直层间距 (m)
+        :param shape: 水平网格点数 (nx, ny)，为 None 时由数据确定
+        :return: 是否开始计算
+        """
+        svps = [svp for svp in self.svps if svp.proj_qc and svp.status == 1]
+        if not svps or self.view_norm is None:
+            return False
+        depth, speed = stack_profiles(svps)
+        east = [svp.east for svp in svps]
+        north = [svp.north for svp in svps]
+        lat = [svp.latitude for svp in svps]
+        lon = [svp.longitude for svp in svps]
+        max_depth = np.nanmax(depth)
+        data_shape, num_levels = volume_shape(east, north, max_depth, depth_step,
+                                              max_voxels=self.volume_renderer.max_voxels)
+        shape = data_shape if shape is None else shape
+        x_o, y_o, z_o, l_max, d_max = self.view_norm
+
+        def build():
+            levels = np.linspace(0.0, max_depth, num_levels)
+            values = resample_profiles(depth, speed, levels)
+            east_axis, north_axis, volume = grid_volume(east, north, lat, lon, values, levels, shape)
+            # 深度轴翻转为自下而上，使 z 方向间距为正
+            volume = volume[:, :, ::-1]
+            origin = [(east_axis[0]-x_o)/l_max, (north_axis[0]-y_o)/l_max, (-levels[-1]-z_o)/d_max]
+            spacing = [np.ptp(east_axis)/max(shape[0]-1, 1)/l_max,
+                       np.ptp(north_axis)/max(shape[1]-1, 1)/l_max,
+                       (levels[1]-levels[0])/d_max]
+            return volume, origin, spacing
+
+        def ready():
+            self.statusBar().clearMessage()
+            if on_ready is not None:
+                on_ready()
+
+        self.statusBar().showMessage(f"Gridding {len(svps)} profiles to {shape[0]}×{shape[1]}×{num_levels}...")
+        self.volume_renderer.load_volume(build, ready)
+        return True
+
+    def with_volume(self, action):
+        # 声速体已就绪时直接执行，否则先在后台计算
+        if self.volume_renderer.volume is not None:
+            action()
+        elif not self.volume_renderer.building:
+            self.build_volume(action)
+
+    def on_volume_failed(self, message):
+        self.statusBar().clearMessage()
+        QMessageBox.warning(self, "Volume", message)
+
+    def on_volumeAct_triggered(self):
+        self.with_volume(self.volume_renderer.show_slices)
+
+    def on_isoAct_triggered(self):
+        self.with_volume(self.ask_isosurface)
+
+    def ask_isosurface(self):
+        volume = self.volume_renderer.volume
+        v_min = float(np.nanmin(volume))
+        v_max = float(np.nanmax(volume))
+        # 默认取声道轴：各水柱声速极小值的平均
+        axis_speed = float(np.nanmean(np.nanmin(volume, axis=2)))
+        level, ok = QInputDialog.getDouble(self, "Isosurface", "声速 (m/s)", axis_speed + 1.0, v_min, v_max, 2)
+        if ok:
+            self.volume_renderer.show_isosurface(level)